@@ -1,20 +1,43 @@
+from bisect import bisect_right
+from glob import glob
 from io import BytesIO
+from multiprocessing import cpu_count
 from os import path
 
+import numpy as np
+
 from .datafile.avro import AvroDataFileReader, AvroDataFileWriter
+from .datafile.codec import RAW, split_extension
 from .datafile.json import JSONDataFileReader, JSONDataFileWriter
+from .datafile.utils import get_slice_indexes, iter_prefetch
 from tqdm import tqdm
 
-__all__ = ['DataFile']
+__all__ = ['DataFile', 'PartitionedDataFile']
 
 
 class DataFile(object):
 
     """Interface for file access."""
 
-    def __init__(self, source):
+    def __init__(self, source, fields: list = None, predicate=None, use_mmap: bool = False):
+        """Open a data source.
+
+        Args:
+            source (str, BytesIO, writer): the data to read
+            fields (list(str)): decode only these fields (Avro sources)
+            predicate (callable): iterate only the records for which
+                                  predicate(record) is True (Avro sources)
+            use_mmap (bool): map uncompressed local files in memory
+
+        Returns:
+            DataFile: the instance of this object
+        """
         self.__source = source
-        self.__data_collector = self.__get_collector(source)
+        self.__fields = fields
+        self.__predicate = predicate
+        self.__use_mmap = use_mmap
+        self.__data_collector = self.__get_collector(
+            source, fields, predicate, use_mmap)
         self.__iter = None
         self.__index = 0
 
@@ -24,11 +47,18 @@ class DataFile(object):
     def __setstate__(self, state):
         cur_source = state['source']
         self.__source = cur_source
-        self.__data_collector = self.__get_collector(cur_source)
+        self.__fields = state['fields']
+        self.__predicate = state['predicate']
+        self.__use_mmap = state['use_mmap']
+        self.__data_collector = self.__get_collector(
+            cur_source, self.__fields, self.__predicate, self.__use_mmap)
 
     def __getstate__(self):
         return {
-            'source': self.__source
+            'source': self.__source,
+            'fields': self.__fields,
+            'predicate': self.__predicate,
+            'use_mmap': self.__use_mmap
         }
 
     @property
@@ -36,32 +66,28 @@ class DataFile(object):
         return self.__data_collector.raw_data
 
     @staticmethod
-    def __get_collector(source):
+    def __get_collector(source, fields: list = None, predicate=None, use_mmap: bool = False):
         if isinstance(source, BytesIO):
             tmp = source.read(100).decode("utf-8", errors="ignore")
             source.seek(0)
             if tmp.find("avro.schema") != -1:
-                return AvroDataFileReader(source)
+                return AvroDataFileReader(source, fields, predicate)
             else:
                 return JSONDataFileReader(source)
         elif isinstance(source, AvroDataFileWriter):
-            tmp = BytesIO(source.raw_data)
-            return AvroDataFileReader(tmp)
+            return AvroDataFileReader(source.view(), fields, predicate)
         elif isinstance(source, JSONDataFileWriter):
-            tmp = BytesIO(source.raw_data)
-            return JSONDataFileReader(descriptor=tmp)
+            return JSONDataFileReader(descriptor=source.view())
         elif path.isfile(source):
-            filename, ext = path.splitext(source)
-            if ext == ".gz" or ext == ".bz2":
-                if path.splitext(filename)[1] == ".json":
-                    return JSONDataFileReader(source)
-                else:
-                    raise Exception("Format {} is not supported...".format(
-                        path.splitext(filename)[1]))
-            elif ext == ".avro":
-                return AvroDataFileReader(source)
+            format_, codec = split_extension(source)
+            if format_ == ".json":
+                return JSONDataFileReader(source, use_mmap=use_mmap)
+            elif format_ == ".avro" and codec is RAW:
+                return AvroDataFileReader(
+                    source, fields, predicate, use_mmap)
             else:
-                raise Exception("File type {} is not supported...".format(ext))
+                raise Exception("File type {} is not supported...".format(
+                    format_ + codec.extension))
         elif not path.exists(source):
             raise FileNotFoundError("{}".format(source))
 
@@ -70,20 +96,110 @@ class DataFile(object):
 
     def get_chunks(self, chunksize=100):
         tmp = []
-        for data in tqdm(
-            self.get_data(), unit="record", desc="Chunk extraction"
-        ):
-            tmp.append(data)
-            if len(tmp) == chunksize:
+        with tqdm(unit="record", desc="Chunk extraction") as progress:
+            for data in self.get_data():
+                tmp.append(data)
+                if len(tmp) == chunksize:
+                    progress.update(len(tmp))
+                    yield tmp
+                    tmp = []
+            if len(tmp) != 0:
+                progress.update(len(tmp))
                 yield tmp
-                tmp = []
-        if len(tmp) != 0:
-            yield tmp
+
+    @staticmethod
+    def __to_column(values: list):
+        """Convert the values of a column in a NumPy array if numeric."""
+        if values and all(type(value) in (int, float) for value in values):
+            return np.array(values)
+        return values
+
+    def get_batches(self, size: int = 1000, columns: list = None):
+        """Generate column oriented batches of records.
+
+        Numeric columns (all the values int or float) are NumPy
+        arrays, the others are lists. Missing fields are None.
+
+        Args:
+            size (int): the number of records of a batch
+            columns (list(str)): the fields to extract, if None the
+                                 fields of the first record
+
+        Returns:
+            generator: dicts with a column for each field
+        """
+        batch = None
+        num_records = 0
+        with tqdm(unit="record", desc="Batch extraction") as progress:
+            for record in self.get_data():
+                if batch is None:
+                    if columns is None:
+                        columns = list(record)
+                    batch = {column: [] for column in columns}
+                for column in columns:
+                    batch[column].append(record.get(column))
+                num_records += 1
+                if num_records == size:
+                    progress.update(num_records)
+                    yield {
+                        column: self.__to_column(values)
+                        for column, values in batch.items()
+                    }
+                    batch = {column: [] for column in columns}
+                    num_records = 0
+            if num_records != 0:
+                progress.update(num_records)
+                yield {
+                    column: self.__to_column(values)
+                    for column, values in batch.items()
+                }
 
     def get_data(self):
         for data in self.__data_collector:
             yield data
 
+    def get_data_prefetch(self, depth: int = 4, chunk_size: int = 1000):
+        """Decode the data on a background thread, ahead of the caller.
+
+        Args:
+            depth (int): the maximum number of chunks decoded in advance
+            chunk_size (int): the number of records of a chunk
+
+        Returns:
+            generator: the records
+        """
+        return iter_prefetch(self.get_data(), depth, chunk_size)
+
+    def get_data_parallel(self, processes: int = cpu_count(), ordered: bool = True):
+        """Decode the data with a pool of processes.
+
+        Note:
+            Only data files opened by filename that support parallel
+            reading are split, the others are read sequentially.
+
+        Args:
+            processes (int): the number of processes
+            ordered (bool): keep the records in the file order
+
+        Returns:
+            generator: the records
+        """
+        collector = self.__data_collector
+        if hasattr(collector, 'iter_parallel') and collector.filename is not None:
+            return collector.iter_parallel(processes, ordered=ordered)
+        return self.get_data()
+
+    def take(self, indices) -> list:
+        """Extract a group of records with a single pass on the data.
+
+        Args:
+            indices (iterable(int)): the record indexes
+
+        Returns:
+            list: the records in the order of the indices
+        """
+        return self.__data_collector.take(indices)
+
     def __getitem__(self, idx):
         return self.__data_collector[idx]
 
@@ -108,3 +224,181 @@ class DataFile(object):
 
         """
         return next(self.__iter)
+
+
+class PartitionedDataFile(object):
+
+    """Files of a dataset partitioned in year=/month=/day= folders.
+
+    The partitions of a set of days are read as a single sequence of
+    records. The files are opened only when they are used and the
+    length comes from the metadata of each file (see DataFile.__len__).
+    Only the partitions used by random access stay open, the others are
+    released as soon as the iteration moves past them.
+    """
+
+    def __init__(self, base_path: str, dates, pattern: str = "part-*", fields: list = None, predicate=None, use_mmap: bool = False):
+        """Discover the partitions of a set of days.
+
+        Args:
+            base_path (str): the folder that contains the year= folders
+            dates (iterable(tuple)): the (year, month, day) to read, for
+                                     example from gen_window_dates
+            pattern (str): the glob pattern of the files of a day
+            fields (list(str)): decode only these fields (Avro sources)
+            predicate (callable): iterate only the records for which
+                                  predicate(record) is True (Avro sources)
+            use_mmap (bool): map uncompressed files in memory
+
+        Returns:
+            PartitionedDataFile: the instance of this object
+        """
+        self.__base_path = base_path
+        self.__dates = list(dates)
+        self.__pattern = pattern
+        self.__fields = fields
+        self.__predicate = predicate
+        self.__use_mmap = use_mmap
+        self.__partitions = []
+        self.__missing_dates = []
+        for year, month, day in self.__dates:
+            day_files = sorted(glob(path.join(
+                base_path,
+                "year={}".format(year),
+                "month={}".format(month),
+                "day={}".format(day),
+                pattern
+            )))
+            if not day_files:
+                self.__missing_dates.append((year, month, day))
+            self.__partitions += day_files
+        self.__files = {}
+        self.__offsets = None
+
+    def __getstate__(self):
+        return {
+            'base_path': self.__base_path,
+            'dates': self.__dates,
+            'pattern': self.__pattern,
+            'fields': self.__fields,
+            'predicate': self.__predicate,
+            'use_mmap': self.__use_mmap
+        }
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def partitions(self) -> list:
+        """The file names of the partitions, in date order."""
+        return list(self.__partitions)
+
+    @property
+    def missing_dates(self) -> list:
+        """The (year, month, day) without files, in date order."""
+        return list(self.__missing_dates)
+
+    def __open(self, idx: int) -> 'DataFile':
+        return DataFile(
+            self.__partitions[idx],
+            self.__fields,
+            self.__predicate,
+            self.__use_mmap
+        )
+
+    def partition(self, idx: int) -> 'DataFile':
+        """Open a partition for random access (once).
+
+        Args:
+            idx (int): the partition index
+
+        Returns:
+            DataFile: the partition data
+        """
+        if idx not in self.__files:
+            self.__files[idx] = self.__open(idx)
+        return self.__files[idx]
+
+    def iter_partitions(self):
+        """Generate the partitions to process them separately.
+
+        The partitions are not kept open by this object, each one is
+        released when the caller drops it.
+
+        Returns:
+            generator: the DataFile of each partition
+        """
+        for idx in range(len(self.__partitions)):
+            if idx in self.__files:
+                yield self.__files[idx]
+            else:
+                yield self.__open(idx)
+
+    def __get_offsets(self) -> list:
+        """Get the global index of the first record of each partition."""
+        if self.__offsets is None:
+            self.__offsets = [0]
+            for cur_file in self.iter_partitions():
+                self.__offsets.append(self.__offsets[-1] + len(cur_file))
+        return self.__offsets
+
+    def __len__(self):
+        return self.__get_offsets()[-1]
+
+    def locate(self, idx: int) -> tuple:
+        """Map a global record index to its partition.
+
+        Args:
+            idx (int): the global index, negative values start from the end
+
+        Returns:
+            tuple: (int, int) the partition index and the record
+                   index in that partition
+        """
+        offsets = self.__get_offsets()
+        if idx < 0:
+            idx += offsets[-1]
+        if not 0 <= idx < offsets[-1]:
+            raise IndexError
+        partition = bisect_right(offsets, idx) - 1
+        return partition, idx - offsets[partition]
+
+    def take(self, indices) -> list:
+        """Extract a group of records, a single gather for each partition.
+
+        Args:
+            indices (iterable(int)): the global record indexes
+
+        Returns:
+            list: the records in the order of the indices
+        """
+        indices = list(indices)
+        groups = {}
+        for idx in indices:
+            partition, offset = self.locate(idx)
+            groups.setdefault(partition, set()).add(offset)
+        results = {}
+        for partition, offsets in sorted(groups.items()):
+            offsets = sorted(offsets)
+            for offset, record in zip(offsets, self.partition(partition).take(offsets)):
+                results[(partition, offset)] = record
+        return [results[self.locate(idx)] for idx in indices]
+
+    def __getitem__(self, idx):
+        if isinstance(idx, slice):
+            return self.take(get_slice_indexes(idx, self.__len__))
+        partition, offset = self.locate(idx)
+        return self.partition(partition)[offset]
+
+    def get_data(self):
+        for cur_file in self.iter_partitions():
+            for data in cur_file.get_data():
+                yield data
+
+    def __iter__(self):
+        """Iterate the records of all the partitions lazily.
+
+        Returns:
+            generator: the records
+        """
+        return self.get_data()
@@ -88,6 +88,12 @@ class CMSRecordTest0(FeatureData):
         self.__tot_requests += other.tot_requests
         return self
 
+    def __isub__(self, other: 'CMSRecordTest0'):
+        """Remove a partial aggregate, for example a day out of a window."""
+        self.__tot_wrap_cpu -= other.tot_wrap_cpu
+        self.__tot_requests -= other.tot_requests
+        return self
+
 
 class CMSSimpleRecord(FeatureData):
 
@@ -266,7 +272,7 @@ class CMSDataPopularity(FeatureData):
                     [fun(self.feature[name]) for name, fun in self.__filters]
                 )
                 if self.__valid:
-                    self.__gen_id()
+                    self._gen_id()
             except ValueError as err:
                 print(
                     "Cannot extract features from '{}'".format(cur_file))
@@ -274,6 +280,16 @@ class CMSDataPopularity(FeatureData):
                 pass
 
 
+# Fields of the CMS popularity Avro records used by CMSDataPopularityRaw
+CMS_RAW_FIELDS = ['FileName', 'TaskMonitorId',
+                  'WrapCPU', 'StartedRunningTimeStamp', 'Type']
+
+
+def is_analysis_record(record: dict) -> bool:
+    """Keep only the analysis jobs, as CMSDataPopularityRaw does."""
+    return record['Type'] == "analysis"
+
+
 class CMSDataPopularityRaw(FeatureData):
 
     def __init__(self, data: dict = {},
@@ -1,20 +1,287 @@
 import json
-from io import BytesIO, IOBase
+import mmap
+import re
+from array import array
+from bisect import bisect_right
+from io import BufferedReader, BytesIO, IOBase
+from multiprocessing import Pool, cpu_count
+from os import path
+from types import GeneratorType
 
-from fastavro import writer as fast_writer
 from fastavro import reader as fast_reader
 from fastavro import parse_schema
-
-from .utils import gen_increasing_slice
-
-__all__ = ['AvroDataFileReader']
+from fastavro.write import Writer as FastWriter
+
+from .utils import FileView, get_slice_indexes, is_plain_file
+
+__all__ = ['AvroDataFileReader', 'AvroDataFileWriter', 'infer_record_schema',
+           'project_schema', 'read_header', 'scan_blocks', 'unknown_field']
+
+AVRO_MAGIC = b'Obj\x01'
+SYNC_SIZE = 16
+
+
+def _read_long(descriptor) -> int:
+    """Read a zig-zag variable length long.
+
+    Raises:
+        EOFError: the stream is ended
+
+    """
+    shift = 0
+    result = 0
+    while True:
+        byte = descriptor.read(1)
+        if not byte:
+            raise EOFError
+        result |= (byte[0] & 0x7f) << shift
+        if not byte[0] & 0x80:
+            break
+        shift += 7
+    return (result >> 1) ^ -(result & 1)
+
+
+def read_header(descriptor):
+    """Read the header of an Avro object container file.
+
+    Args:
+        descriptor (file_descriptor): the container stream
+
+    Returns:
+        tuple: (bytes, dict, bytes) the raw header, the metadata map
+               and the sync marker
+
+    """
+    descriptor.seek(0, 0)
+    if descriptor.read(len(AVRO_MAGIC)) != AVRO_MAGIC:
+        raise Exception("The stream is not an Avro object container...")
+    metadata = {}
+    count = _read_long(descriptor)
+    while count != 0:
+        if count < 0:
+            # A negative count is followed by the size of the map block
+            count = -count
+            _read_long(descriptor)
+        for _ in range(count):
+            key = descriptor.read(_read_long(descriptor)).decode("utf-8")
+            metadata[key] = descriptor.read(_read_long(descriptor))
+        count = _read_long(descriptor)
+    sync = descriptor.read(SYNC_SIZE)
+    header_size = descriptor.tell()
+    descriptor.seek(0, 0)
+    return descriptor.read(header_size), metadata, sync
+
+
+def project_schema(schema: dict, fields) -> dict:
+    """Restrict a record schema to a subset of its fields.
+
+    Used as reader schema, the fields left out are skipped while
+    decoding instead of being converted in Python objects.
+
+    Args:
+        schema (dict): the writer schema of the records
+        fields (list(str)): the names of the fields to keep
+
+    Returns:
+        dict: the projected schema
+
+    """
+    names = [field['name'] for field in schema['fields']]
+    missing = [name for name in fields if name not in names]
+    if missing:
+        raise Exception(
+            "Fields {} are not in the schema '{}'...".format(missing, schema.get('name')))
+    projection = dict(schema)
+    projection['fields'] = [
+        field for field in schema['fields'] if field['name'] in fields
+    ]
+    return projection
+
+
+def scan_blocks(descriptor, header_size: int, sync: bytes):
+    """Walk the block headers of an Avro object container file.
+
+    Only the record count and the size of each block are decoded,
+    the block data is skipped with a seek.
+
+    Args:
+        descriptor (file_descriptor): the container stream
+        header_size (int): the size of the container header
+        sync (bytes): the sync marker of the container
+
+    Returns:
+        tuple: (array, array) the block offsets and the index of the
+               first record of each block, both with a final entry
+               for the end of the file
+
+    """
+    offsets = array('Q')
+    records = array('Q', [0])
+    descriptor.seek(header_size, 0)
+    while True:
+        offset = descriptor.tell()
+        try:
+            num_records = _read_long(descriptor)
+        except EOFError:
+            break
+        descriptor.seek(_read_long(descriptor), 1)
+        if descriptor.read(SYNC_SIZE) != sync:
+            raise Exception(
+                "Avro block at offset {} has a wrong sync marker...".format(offset))
+        offsets.append(offset)
+        records.append(records[-1] + num_records)
+    offsets.append(offset)
+    return offsets, records
+
+
+# Avro names of the Python types, bool before int because it is a subclass
+_PRIMITIVE_TYPES = [
+    (bool, "boolean"),
+    (int, "long"),
+    (float, "double"),
+    (str, "string"),
+    (bytes, "bytes")
+]
+
+_AVRO_NAME = re.compile(r"^[A-Za-z_][A-Za-z0-9_]*$")
+
+
+def infer_type(values: list, name: str):
+    """Infer the Avro type that can encode all the values.
+
+    Different types of the values become a union (with "null" first
+    when there are missing values), ints mixed with floats are encoded
+    as doubles, lists become arrays and dictionaries become records,
+    or maps when their keys are not valid Avro names.
+
+    Args:
+        values (list): the values of a field
+        name (str): the name of the records created for dictionaries
+
+    Returns:
+        str, dict or list: the Avro type
+
+    """
+    branches = []
+    if any(value is None for value in values):
+        branches.append("null")
+    for type_, avro_type in _PRIMITIVE_TYPES:
+        if any(type(value) is type_ for value in values):
+            branches.append(avro_type)
+    if "long" in branches and "double" in branches:
+        branches.remove("long")
+    lists = [value for value in values if isinstance(value, list)]
+    if lists:
+        branches.append({
+            'type': "array",
+            'items': infer_type(
+                [elm for value in lists for elm in value], name + "_item")
+        })
+    dicts = [value for value in values if isinstance(value, dict)]
+    if dicts:
+        keys = {key for value in dicts for key in value}
+        if all(_AVRO_NAME.match(key) for key in keys):
+            branches.append(infer_record_schema(dicts, name))
+        else:
+            branches.append({
+                'type': "map",
+                'values': infer_type(
+                    [elm for value in dicts for elm in value.values()], name + "_value")
+            })
+    if not branches:
+        return "null"
+    return branches[0] if len(branches) == 1 else branches
+
+
+def infer_record_schema(records: list, name: str = "data") -> dict:
+    """Infer a record schema from a sample of records.
+
+    Fields missing in some of the records are nullable.
+
+    Args:
+        records (list(dict)): the sample of records
+        name (str): the record name
+
+    Returns:
+        dict: the record schema
+
+    """
+    names = []
+    for record in records:
+        names += [key for key in record if key not in names]
+    fields = []
+    for key in names:
+        field = {
+            'name': key,
+            'type': infer_type(
+                [record.get(key) for record in records], "{}_{}".format(name, key))
+        }
+        if isinstance(field['type'], list) and "null" in field['type'] or field['type'] == "null":
+            field['default'] = None
+        fields.append(field)
+    return {'type': "record", 'name': name, 'fields': fields}
+
+
+def unknown_field(datum, avro_type, name: str = ""):
+    """Find a key of a record that is not in its schema.
+
+    The Avro encoders ignore these keys, so they would be lost.
+
+    Args:
+        datum: the value to check
+        avro_type (str, dict or list): the parsed Avro type of the value
+        name (str): the path of the value, for the result
+
+    Returns:
+        str: the path of the first unknown key, None if there is none
+
+    """
+    if isinstance(avro_type, list):
+        # Check the union branches that can hold the value
+        results = [
+            unknown_field(datum, branch, name) for branch in avro_type
+            if isinstance(branch, dict) and (
+                isinstance(datum, dict) and branch['type'] in ("record", "map") or
+                isinstance(datum, list) and branch['type'] == "array")
+        ]
+        if results and None not in results:
+            return results[0]
+        return None
+    if not isinstance(avro_type, dict):
+        return None
+    if avro_type['type'] == "record" and isinstance(datum, dict):
+        fields = {field['name']: field['type'] for field in avro_type['fields']}
+        for key, value in datum.items():
+            if key not in fields:
+                return "{}.{}".format(name, key) if name else key
+            result = unknown_field(
+                value, fields[key], "{}.{}".format(name, key) if name else key)
+            if result is not None:
+                return result
+    elif avro_type['type'] == "map" and isinstance(datum, dict):
+        for key, value in datum.items():
+            result = unknown_field(
+                value, avro_type['values'], "{}[{}]".format(name, key))
+            if result is not None:
+                return result
+    elif avro_type['type'] == "array" and isinstance(datum, list):
+        for idx, value in enumerate(datum):
+            result = unknown_field(
+                value, avro_type['items'], "{}[{}]".format(name, idx))
+            if result is not None:
+                return result
+    return None
 
 
 class AvroDataFileWriter(object):
 
-    """Write an avro file."""
+    """Write an avro file.
+
+    The records are encoded in a single object container, buffered in
+    blocks of sync_interval bytes that are compressed with the codec.
+    """
 
-    def __init__(self, filename, data=None, schema=None, codec: str = 'snappy'):
+    def __init__(self, filename: str = None, descriptor: 'IOBase' = None, data=None, schema: dict = None, codec: str = 'snappy', sync_interval: int = 16000, compression_level: int = None, schema_sample: int = 1000):
         """Create an avro archive.
 
         Note:
@@ -22,134 +289,258 @@ class AvroDataFileWriter(object):
 
         Args:
             filename (str): the output filename
-            data (dict, list(dict)): the data to write
-            schema (dict): the avro schema as dictionary
+            descriptor (IOBase): the output stream, instead of a filename
+            data (dict, str, list(dict), list(str)): the data to write,
+                                                     JSON strings are decoded
+            schema (dict): the avro schema as dictionary, if None it is
+                           inferred from the first schema_sample records
+            codec (str): the block codec, 'snappy', 'deflate' or 'null'
+            sync_interval (int): the approximate size of a block
+            compression_level (int): the compression level of the codec
+            schema_sample (int): the number of records used to infer
+                                 the schema
 
         Returns:
             AvroDataFileWriter: the instance of this object
         """
+        assert any([filename is not None, descriptor is not None]
+                   ), "You have to specify a filename or a descriptor..."
         self.__filename = filename
-        self.__descriptor = open(self.__filename, 'wb')
+        self.__descriptor = descriptor
+        if not self.__descriptor:
+            self.__descriptor = open(self.__filename, 'wb')
         self.__schema = None
         self.__codec = codec
+        self.__sync_interval = sync_interval
+        self.__compression_level = compression_level
+        self.__schema_sample = schema_sample
+        self.__writer = None
+        self.__pending = []
+        self.__len = 0
         if schema:
-            self.__schema = json.dumps(schema).encode("utf-8")
+            self.__schema = parse_schema(schema)
         if data is not None:
             self.append(data)
 
     @property
     def raw_data(self):
+        self.flush()
         self.__descriptor.seek(0, 0)
-        return self.__descriptor.read()
+        data = self.__descriptor.read()
+        self.__descriptor.seek(0, 2)
+        return data
+
+    def view(self):
+        """Get a read-only stream of the data written so far.
+
+        The output file is shared with a FileView, without reading it
+        in memory, other outputs are copied in a BytesIO.
+
+        Returns:
+            file_descriptor: the stream of the written data
 
-    @staticmethod
-    def __get_primitive_type(key, value):
-        if isinstance(value, bool):
-            return "boolean"
-        elif isinstance(value, int):
-            return "int"
-        elif isinstance(value, float):
-            return "float"
-        elif isinstance(value, str):
-            return "string"
-        elif isinstance(value, bytes):
-            return "bytes"
-
-    def __get_schema(self, data):
-        """Generate an avro schema from data automatically.
-
-        NOTE:
-            Only supports basic types and arrays.
         """
-        schema = {
-            'namespace': "datamanager.avro",
-            'type': "record",
-            'name': "data",
-            'fields': []
-        }
-        for key, value in data.items():
-            prim_type = self.__get_primitive_type(value)
-            if prim_type is not None:
-                schema['fields'].append(
-                    {'name': key, 'type': prim_type}
-                )
-            else:
-                if isinstance(value, list):
-                    prim_type = self.__get_primitive_type(value[0])
-                    schema['fields'].append(
-                        {'name': key, 'type': "array", 'items': prim_type}
-                    )
-                elif isinstance(value, dict):
-                    prim_type = self.__get_primitive_type(value.values()[0])
-                    schema['fields'].append(
-                        {'name': key, 'type': "map", 'items': prim_type}
-                    )
-                else:
-                    raise Exception(
-                        "Type '{}' of field '{}' is not supported...".format(type(value), key))
-
-        return json.dumps(schema).encode("utf-8")
-
-    def __write(self, data):
-        """Write data into the avro file."""
-        if not self.__schema:
-            self.__schema = parse_schema(self.__get_schema(data[0]))
-
-        fast_writer(self.__descriptor, self.__schema, data, self.__codec)
+        self.flush()
+        if is_plain_file(self.__descriptor):
+            return BufferedReader(FileView(self.__descriptor.fileno()))
+        return BytesIO(self.raw_data)
 
-    def append(self, data):
-        """Add data to the avro archive."""
-        if isinstance(data, dict):
-            self.__write([data])
-        elif isinstance(data, list):
-            if all(isinstance(elm, dict) for elm in data):
-                self.__write(data)
-            else:
+    @property
+    def schema(self) -> dict:
+        return self.__schema
+
+    def __len__(self):
+        return self.__len
+
+    def __open_container(self):
+        """Write the container header, inferring the schema if needed."""
+        if self.__schema is None:
+            self.__schema = parse_schema(
+                infer_record_schema(self.__pending))
+        self.__writer = FastWriter(
+            self.__descriptor, self.__schema, self.__codec,
+            sync_interval=self.__sync_interval,
+            compression_level=self.__compression_level,
+            validator=True
+        )
+
+    def __write(self, records: list, force: bool = False):
+        """Encode the records in the current block.
+
+        The records are kept aside until there are enough of them to
+        infer the schema, unless force is True. Every record is checked
+        against the schema: values of another type raise a
+        ValidationError and keys missing in the schema an Exception,
+        instead of being converted or dropped by the encoder.
+        """
+        if self.__writer is None:
+            self.__pending += records
+            if not force and self.__schema is None and len(self.__pending) < self.__schema_sample:
+                return
+            self.__open_container()
+            records, self.__pending = self.__pending, []
+        for record in records:
+            field = unknown_field(record, self.__schema)
+            if field is not None:
                 raise Exception(
-                    "You can pass only a list of 'dict'"
-                )
+                    "Field '{}' is not in the schema of the avro file...".format(field))
+            self.__writer.write(record)
+
+    @staticmethod
+    def __decode(data) -> dict:
+        if isinstance(data, dict):
+            return data
+        elif isinstance(data, str):
+            return json.loads(data)
+        raise Exception(
+            "You can pass only a list of 'dict' or JSON strings"
+        )
+
+    def append(self, data):
+        """Add data to the avro archive.
+
+        Args:
+            data (str, dict, list(str), list(dict)): data to be inserted
+
+        Returns:
+            AvroDataFileWriter: this object instance
+
+        """
+        if isinstance(data, (str, dict)):
+            self.__write([self.__decode(data)])
+            self.__len += 1
+        elif isinstance(data, (list, GeneratorType)):
+            self.extend(data)
         else:
             raise Exception(
                 "'{}' is not a valid input data type".format(type(data)))
 
         return self
 
+    def extend(self, data, validate: bool = True):
+        """Add many records to the avro archive.
+
+        Args:
+            data (iterable(str or dict)): JSON strings or dictionaries
+            validate (bool): kept for compatibility with
+                             JSONDataFileWriter.extend, the records are
+                             always checked against the schema
+
+        Returns:
+            AvroDataFileWriter: this object instance
+
+        """
+        records = [self.__decode(elm) for elm in data]
+        self.__write(records)
+        self.__len += len(records)
+        return self
+
+    def append_file(self, filename: str, records: int = None):
+        """Add the records of an uncompressed JSON file.
+
+        Args:
+            filename (str): a file of newline terminated JSON strings,
+                            for example written by another process
+            records (int): the number of records of the file (unused,
+                           the records are decoded anyway)
+
+        Returns:
+            AvroDataFileWriter: this object instance
+
+        """
+        with open(filename, 'rb') as in_file:
+            self.extend((json.loads(line) for line in in_file), validate=False)
+        return self
+
+    def flush(self):
+        """Write the current block.
+
+        A writer without records and schema gets the schema of an empty
+        record, as the container needs a valid header to be read.
+        """
+        if self.__writer is None and self.__schema is None and not self.__pending:
+            self.__schema = parse_schema(infer_record_schema([]))
+        if self.__writer is None:
+            self.__write([], force=True)
+        self.__writer.flush()
+
+    def close(self):
+        """Write the last block and close the file."""
+        if self.__descriptor.closed:
+            return
+        self.flush()
+        self.__descriptor.close()
+
     def __del__(self):
         """Object destructor."""
-        if not self.__descriptor.closed:
-            self.__descriptor.close()
+        self.close()
 
     def __enter__(self):
         """Initialization for 'with' statement.
 
         Returns:
-            JSONDataFileWriter: this object instance
+            AvroDataFileWriter: this object instance
 
         """
         return self
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Closing function for the 'with' statement."""
-        if not self.__descriptor.closed:
-            self.__descriptor.close()
+        self.close()
+
+
+def read_blocks(args):
+    """Decode the records of a range of blocks.
+
+    Note: this is the worker function of AvroDataFileReader.iter_parallel.
+
+    Args:
+        args (tuple): (filename, start, stop, fields, predicate, use_mmap)
+                      the file, the range of block offsets to decode,
+                      the projection and filter of the records and the
+                      reader mode
+
+    Returns:
+        list(dict): the decoded records
+    """
+    filename, start, stop, fields, predicate, use_mmap = args
+    with AvroDataFileReader(filename, fields, predicate, use_mmap) as reader:
+        return list(reader.iter_range(start, stop))
 
 
 class AvroDataFileReader(object):
 
     """Read an avro file."""
 
-    def __init__(self, file_):
+    def __init__(self, file_, fields: list = None, predicate=None, use_mmap: bool = False):
         """Init function of data reader for .avro files.
 
         Args:
             file_ (str): name of the .avro file to read.
+            fields (list(str)): decode only these fields of the records,
+                                the others are skipped
+            predicate (callable): keep only the records for which
+                                  predicate(record) is True during the
+                                  iteration (len and indexes still refer
+                                  to all the records of the file)
+            use_mmap (bool): map the file in memory, the blocks are read
+                             from the mapping (only for file names)
 
         Returns:
             AvroDataFileReader: the instance of this object
 
         """
         self.__descriptor = None
-        if isinstance(file_, str):
+        self.__filename = None
+        self.__view = None
+        if isinstance(file_, str) and use_mmap and path.getsize(file_) > 0:
+            self.__filename = file_
+            with open(file_, 'rb') as map_file:
+                self.__descriptor = mmap.mmap(
+                    map_file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__view = memoryview(self.__descriptor)
+        elif isinstance(file_, str):
+            self.__filename = file_
             self.__descriptor = open(file_, 'rb')
         elif isinstance(file_, (BytesIO, IOBase)):
             self.__descriptor = file_
@@ -157,30 +548,191 @@ class AvroDataFileReader(object):
             raise Exception(
                 "Type '{}' for file_ is not supported...".format(type(file_)))
         self.__avro_iter = None
-        self.__len = None
+        self.__fields = fields
+        self.__predicate = predicate
+        self.__reader_schema = None
+        self.__header = None
+        self.__metadata = None
+        self.__sync = None
+        self.__block_offsets = None
+        self.__block_records = None
+        if fields is not None:
+            self.__load_header()
+            self.__reader_schema = project_schema(
+                json.loads(self.__metadata['avro.schema']), fields)
+
+    def __load_header(self):
+        """Read the container header, once."""
+        if self.__header is None:
+            self.__header, self.__metadata, self.__sync = read_header(
+                self.__descriptor)
+
+    def __load_blocks(self):
+        """Build the block map of the container, once."""
+        if self.__block_offsets is None:
+            # Keep the position of a running iteration
+            position = self.__descriptor.tell()
+            self.__load_header()
+            self.__block_offsets, self.__block_records = scan_blocks(
+                self.__descriptor, len(self.__header), self.__sync)
+            self.__descriptor.seek(position, 0)
+
+    def __get_container(self, start: int, stop: int = None) -> BytesIO:
+        """Get a container made of the header and a range of blocks.
+
+        Args:
+            start (int): the offset of the first block
+            stop (int): the offset of the block after the range,
+                        None for the end of file
+
+        Returns:
+            BytesIO: the container stream
+
+        """
+        if self.__view is not None:
+            data = self.__view[start:stop]
+        else:
+            position = self.__descriptor.tell()
+            self.__descriptor.seek(start, 0)
+            data = self.__descriptor.read(-1 if stop is None else stop - start)
+            self.__descriptor.seek(position, 0)
+        return BytesIO(b''.join([self.__header, data]))
+
+    def __read_block(self, block: int) -> list:
+        """Decode the records of a single block.
+
+        Args:
+            block (int): the block index
+
+        Returns:
+            list(dict): the records of the block
+
+        """
+        return list(fast_reader(
+            self.__get_container(
+                self.__block_offsets[block], self.__block_offsets[block + 1]),
+            reader_schema=self.__reader_schema
+        ))
 
     def __len__(self):
-        if not self.__len:
-            counter = 0
-            self.__descriptor.seek(0, 0)
-            print("[Check avro lenght...]")
-            for _ in fast_reader(self.__descriptor):
-                counter += 1
-            self.__len = counter
-        return self.__len
+        """Count the records using the block headers of the container."""
+        self.__load_blocks()
+        return self.__block_records[-1]
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    def iter_range(self, start: int, stop: int = None):
+        """Iterate the records of a range of blocks.
+
+        Args:
+            start (int): the offset of the first block
+            stop (int): the offset of the block after the range,
+                        None for the end of file
+
+        Returns:
+            generator: the records, filtered by the predicate
+        """
+        self.__load_header()
+        records = fast_reader(
+            self.__get_container(start, stop), reader_schema=self.__reader_schema)
+        if self.__predicate is not None:
+            records = filter(self.__predicate, records)
+        return records
+
+    def ranges(self, num_ranges: int):
+        """Split the file in ranges of whole blocks.
+
+        Args:
+            num_ranges (int): the maximum number of ranges
+
+        Returns:
+            list(tuple): the (start, stop) offsets of each range,
+                         the last stop is None
+        """
+        self.__load_blocks()
+        num_blocks = len(self.__block_offsets) - 1
+        boundaries = sorted(set(
+            self.__block_offsets[cur * num_blocks // num_ranges]
+            for cur in range(num_ranges)
+        ))
+        return list(zip(boundaries, boundaries[1:] + [None]))
+
+    def iter_parallel(self, processes: int = cpu_count(), ordered: bool = True, ranges_per_process: int = 4):
+        """Decode the file with a pool of processes.
+
+        Each process decompresses, decodes and filters a range of
+        blocks (see the ranges method), the file is opened again by
+        every process, so the predicate has to be picklable. A file
+        with a single range is read in this process.
+
+        Args:
+            processes (int): the number of processes
+            ordered (bool): keep the records in the file order
+            ranges_per_process (int): number of ranges for each process
+
+        Returns:
+            generator: the records
+        """
+        assert self.__filename is not None, "Parallel reading needs a filename..."
+        ranges = self.ranges(processes * ranges_per_process)
+        if len(ranges) == 1:
+            yield from self.iter_range(*ranges[0])
+            return
+        tasks = [
+            (self.__filename, start, stop, self.__fields,
+             self.__predicate, self.__view is not None)
+            for start, stop in ranges
+        ]
+        with Pool(processes) as pool:
+            mapper = pool.imap if ordered else pool.imap_unordered
+            for records in mapper(read_blocks, tasks):
+                for record in records:
+                    yield record
 
     @property
     def raw_data(self):
         self.__descriptor.seek(0, 0)
         return self.__descriptor.read()
 
+    def take(self, indices) -> list:
+        """Extract a group of records decoding only their blocks.
+
+        Args:
+            indices (iterable(int)): the record indexes, negative
+                                     values start from the end
+
+        Returns:
+            list(dict): the records in the order of the indices
+
+        """
+        indices = list(indices)
+        num_records = len(self)
+        indices = [idx + num_records if idx < 0 else idx for idx in indices]
+        results = {}
+        cur_block = -1
+        records = []
+
+        for target_idx in sorted(set(indices)):
+            if not 0 <= target_idx < num_records:
+                raise IndexError
+            block = bisect_right(self.__block_records, target_idx) - 1
+            if block != cur_block:
+                records = self.__read_block(block)
+                cur_block = block
+            results[target_idx] = records[
+                target_idx - self.__block_records[block]]
+
+        return [results[idx] for idx in indices]
+
     def __getitem__(self, idx):
         """Select an item or a group of item from the file.
 
         If the idx argument is a slice it is converted to a list
-        of indexes. All index lists will be processed in increasing
-        order (datafile.utils.gen_increasing_slice function for more details)
-        and then will be returned in the order requested by the user.
+        of indexes (datafile.utils.get_slice_indexes function for more
+        details) that are extracted with a single pass (see take)
+        and then returned in the order requested by the user.
 
         Args:
             idx (int or slice): indexes to extract
@@ -193,33 +745,8 @@ class AvroDataFileReader(object):
             idx, (int, slice)), "Index Could be an integer or a slice"
 
         if isinstance(idx, slice):
-            to_extract = [elm for elm in gen_increasing_slice(idx)]
-        else:
-            to_extract = [idx]
-
-        results = []
-        cur_idx = -1
-        self.__descriptor.seek(0, 0)
-        self.__avro_iter = fast_reader(self.__descriptor)
-
-        while len(to_extract):
-            try:
-                cur_elm = next(self.__avro_iter)
-            except StopIteration:
-                raise IndexError
-
-            cur_idx += 1
-
-            if cur_idx == to_extract[0]:
-                results.append(cur_elm)
-                to_extract.pop(0)
-
-        if isinstance(idx, slice):
-            if idx.start is not None and idx.stop is not None and idx.start > idx.stop:
-                return list(reversed(results))
-            return results
-        else:
-            return results.pop(0)
+            return self.take(get_slice_indexes(idx, self.__len__))
+        return self.take([idx])[0]
 
     def __iter__(self):
         """Initialize the Avro reader iterator.
@@ -229,7 +756,10 @@ class AvroDataFileReader(object):
 
         """
         self.__descriptor.seek(0, 0)
-        self.__avro_iter = fast_reader(self.__descriptor)
+        self.__avro_iter = fast_reader(
+            self.__descriptor, reader_schema=self.__reader_schema)
+        if self.__predicate is not None:
+            self.__avro_iter = filter(self.__predicate, self.__avro_iter)
         return self
 
     def __next__(self):
@@ -244,10 +774,17 @@ class AvroDataFileReader(object):
         """
         return next(self.__avro_iter)
 
+    def close(self):
+        """Close the file (or release the mapping)."""
+        if self.__view is not None:
+            self.__view.release()
+            self.__view = None
+        if self.__descriptor is not None and not self.__descriptor.closed:
+            self.__descriptor.close()
+
     def __del__(self):
         """Object destructor."""
-        if not self.__descriptor.closed:
-            self.__descriptor.close()
+        self.close()
 
     def __enter__(self):
         """Initialization for 'with' statement.
@@ -260,5 +797,4 @@ class AvroDataFileReader(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Closing function for the 'with' statement."""
-        if not self.__descriptor.closed:
-            self.__descriptor.close()
+        self.close()
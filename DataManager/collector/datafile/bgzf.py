@@ -0,0 +1,365 @@
+import struct
+import zlib
+from array import array
+from bisect import bisect_right
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import path, remove
+
+__all__ = ['BLOCK_SIZE', 'BlockGzipReader', 'BlockGzipWriter', 'blocks_path',
+           'remove_blocks']
+
+BLOCK_SIZE = 1 << 16
+
+# Member header without mtime, flags or extra fields and OS 'unknown'
+_GZIP_HEADER = b'\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff'
+
+
+def blocks_path(filename: str) -> str:
+    """Get the sidecar block table filename of a block gzip file.
+
+    Args:
+        filename (str): the data file name
+
+    Returns:
+        str: the block table file name
+
+    """
+    return "{}.blocks".format(filename)
+
+
+def remove_blocks(filename: str):
+    """Remove the sidecar block table of a data file, if any."""
+    table_filename = blocks_path(filename)
+    if path.isfile(table_filename):
+        remove(table_filename)
+
+
+def compress_member(data: bytes, level: int = 9) -> bytes:
+    """Compress data in a standalone gzip member.
+
+    Args:
+        data (bytes): the data to compress
+        level (int): the zlib compression level
+
+    Returns:
+        bytes: the gzip member
+
+    """
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+    return b''.join([
+        _GZIP_HEADER,
+        compressor.compress(data),
+        compressor.flush(),
+        struct.pack("<II", zlib.crc32(data) & 0xffffffff,
+                    len(data) & 0xffffffff)
+    ])
+
+
+def read_table(filename: str):
+    """Read the block table of a block gzip file.
+
+    The table is a flat array of unsigned 64 bit integers with a
+    triple (compressed offset, decompressed offset, first record index)
+    for each member, plus a final triple that marks the end of the file.
+
+    Args:
+        filename (str): the data file name
+
+    Returns:
+        array: the block table
+
+    """
+    table = array('Q')
+    with open(blocks_path(filename), 'rb') as table_file:
+        table.frombytes(table_file.read())
+    return table
+
+
+class BlockGzipWriter(object):
+
+    """Write a gzip file as a sequence of independent members.
+
+    Each member holds at most block_size decompressed bytes (or a single
+    bigger line) and always ends at a newline, so members never split
+    the records of line based formats. The resulting file is a standard
+    multi-member gzip file.
+
+    With more than one worker the members are compressed on a thread
+    pool (zlib releases the GIL) and written in order.
+    """
+
+    def __init__(self, filename: str, mode: str = 'wb', block_size: int = BLOCK_SIZE, level: int = 9, workers: int = 1):
+        """Create or append to a block gzip file.
+
+        Args:
+            filename (str): the output filename
+            mode (str): 'wb' or 'ab'
+            block_size (int): max decompressed size of a member
+            level (int): the zlib compression level
+            workers (int): number of compression threads
+
+        Returns:
+            BlockGzipWriter: the instance of this object
+
+        """
+        assert mode in ['wb', 'ab'], "Mode '{}' not supported...".format(mode)
+        self.__filename = filename
+        self.__block_size = block_size
+        self.__level = level
+        self.__workers = workers
+        self.__executor = None
+        if workers > 1:
+            self.__executor = ThreadPoolExecutor(workers)
+        self.__pending = deque()
+        self.__buffer = []
+        self.__buffer_len = 0
+        self.__table = array('Q', [0, 0, 0])
+        if mode == 'ab' and path.isfile(blocks_path(filename)):
+            self.__table = read_table(filename)
+        elif mode == 'ab' and path.isfile(filename) and path.getsize(filename) > 0:
+            raise Exception(
+                "Cannot append to '{}' without its block table...".format(filename))
+        # Decompressed size and records of written and pending members
+        self.__size = self.__table[-2]
+        self.__records = self.__table[-1]
+        self.__descriptor = open(filename, mode)
+
+    @property
+    def closed(self) -> bool:
+        return self.__descriptor.closed
+
+    @property
+    def num_records(self) -> int:
+        return self.__records + sum(
+            data.count(b'\n') for data in self.__buffer)
+
+    def tell(self) -> int:
+        """Get the position in the decompressed stream."""
+        return self.__size + self.__buffer_len
+
+    def write(self, data: bytes) -> int:
+        """Buffer data, members are written when a block is full.
+
+        Args:
+            data (bytes): the data to write
+
+        Returns:
+            int: the number of bytes written
+
+        """
+        self.__buffer.append(data)
+        self.__buffer_len += len(data)
+        if self.__buffer_len >= self.__block_size:
+            self.__write_blocks(last=False)
+        return len(data)
+
+    def __write_pending(self):
+        """Write the oldest compressed member and update the block table."""
+        member, size, records = self.__pending.popleft()
+        if self.__executor is not None:
+            member = member.result()
+        self.__descriptor.write(member)
+        _, u_offset, first_record = self.__table[-3:]
+        self.__table.extend([
+            self.__descriptor.tell(),
+            u_offset + size,
+            first_record + records
+        ])
+
+    def __add_member(self, data, records: int):
+        """Compress a member, in the thread pool if there is one.
+
+        Args:
+            data (bytes or memoryview): the member content
+            records (int): the number of lines in the member
+
+        """
+        if self.__executor is not None:
+            member = self.__executor.submit(compress_member, data, self.__level)
+        else:
+            member = compress_member(data, self.__level)
+        self.__pending.append((member, len(data), records))
+        self.__size += len(data)
+        self.__records += records
+        # Bound the memory used by the members in flight
+        while len(self.__pending) > (2 * self.__workers if self.__executor else 0):
+            self.__write_pending()
+
+    def __write_blocks(self, last: bool = True):
+        """Split the buffered data in members cut at newlines.
+
+        Args:
+            last (bool): write also the final partial block, otherwise
+                         it is kept in the buffer
+
+        """
+        data = b''.join(self.__buffer)
+        view = memoryview(data)
+        start = 0
+        while len(data) - start >= self.__block_size:
+            stop = data.rfind(b'\n', start, start + self.__block_size) + 1
+            if stop <= start:
+                # A single line bigger than a block
+                stop = data.find(b'\n', start + self.__block_size) + 1
+                if stop <= start:
+                    break
+            self.__add_member(view[start:stop], data.count(b'\n', start, stop))
+            start = stop
+        if last and start < len(data):
+            self.__add_member(view[start:], data.count(b'\n', start))
+            start = len(data)
+        self.__buffer = [data[start:]] if start < len(data) else []
+        self.__buffer_len = len(data) - start
+
+    def flush(self):
+        """Write all the buffered data."""
+        if self.__buffer_len > 0:
+            self.__write_blocks(last=True)
+        while self.__pending:
+            self.__write_pending()
+
+    def close(self):
+        """Write the last member and the block table."""
+        if self.__descriptor.closed:
+            return
+        self.flush()
+        if self.__executor is not None:
+            self.__executor.shutdown()
+        self.__descriptor.close()
+        with open(blocks_path(self.__filename), 'wb') as table_file:
+            self.__table.tofile(table_file)
+
+    def __del__(self):
+        """Object destructor."""
+        self.close()
+
+
+class BlockGzipReader(object):
+
+    """Seekable reader of a block gzip file.
+
+    A seek in the decompressed stream decompresses only the member that
+    contains the target position.
+    """
+
+    def __init__(self, filename: str):
+        """Open a block gzip file with its block table.
+
+        Args:
+            filename (str): the file to read
+
+        Returns:
+            BlockGzipReader: the instance of this object
+
+        """
+        table = read_table(filename)
+        self.__c_offsets = table[0::3]
+        self.__u_offsets = table[1::3]
+        self.__records = table[2::3]
+        self.__descriptor = open(filename, 'rb')
+        self.__member = -1
+        self.__data = b''
+        self.__offset = 0
+
+    @property
+    def closed(self) -> bool:
+        return self.__descriptor.closed
+
+    @property
+    def num_records(self) -> int:
+        return self.__records[-1]
+
+    @property
+    def size(self) -> int:
+        return self.__u_offsets[-1]
+
+    def checkpoints(self):
+        """Generate the (record index, position) pairs of member starts."""
+        for member in range(len(self.__records) - 1):
+            yield self.__records[member], self.__u_offsets[member]
+
+    def __load(self, member: int):
+        """Decompress a member.
+
+        Args:
+            member (int): the member index, the last one is the empty end
+
+        """
+        self.__member = member
+        self.__offset = 0
+        if member >= len(self.__c_offsets) - 1:
+            self.__data = b''
+            return
+        self.__descriptor.seek(self.__c_offsets[member])
+        self.__data = zlib.decompress(
+            self.__descriptor.read(
+                self.__c_offsets[member + 1] - self.__c_offsets[member]),
+            16 + zlib.MAX_WBITS
+        )
+
+    def tell(self) -> int:
+        """Get the position in the decompressed stream."""
+        if self.__member == -1:
+            return 0
+        return self.__u_offsets[self.__member] + self.__offset
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        """Move to a position in the decompressed stream.
+
+        Args:
+            pos (int): the position
+            whence (int): 0 from the start, 1 from the current
+                          position and 2 from the end
+
+        Returns:
+            int: the new position
+
+        """
+        if whence == 1:
+            pos += self.tell()
+        elif whence == 2:
+            pos += self.size
+        pos = min(max(pos, 0), self.size)
+        member = bisect_right(self.__u_offsets, pos) - 1
+        if member != self.__member:
+            self.__load(member)
+        self.__offset = pos - self.__u_offsets[member]
+        return pos
+
+    def read(self, size: int = -1) -> bytes:
+        """Read decompressed data.
+
+        Args:
+            size (int): the number of bytes to read, -1 reads to the end
+
+        Returns:
+            bytes: the data read
+
+        """
+        if self.__member == -1:
+            self.__load(0)
+        chunks = []
+        while size != 0:
+            if self.__offset >= len(self.__data):
+                if self.__member >= len(self.__c_offsets) - 1:
+                    break
+                self.__load(self.__member + 1)
+                continue
+            if size < 0:
+                chunk = self.__data[self.__offset:]
+            else:
+                chunk = self.__data[self.__offset:self.__offset + size]
+                size -= len(chunk)
+            self.__offset += len(chunk)
+            chunks.append(chunk)
+        return b''.join(chunks)
+
+    def close(self):
+        """Close the file."""
+        if not self.__descriptor.closed:
+            self.__descriptor.close()
+
+    def __del__(self):
+        """Object destructor."""
+        self.close()
@@ -0,0 +1,252 @@
+import bz2
+import gzip
+import lzma
+from os import path
+
+from .bgzf import (BLOCK_SIZE, BlockGzipReader, BlockGzipWriter, blocks_path,
+                   remove_blocks)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame as lz4_frame
+except ImportError:
+    lz4_frame = None
+
+__all__ = ['CODECS', 'RAW', 'Codec', 'ZstdFile', 'register_codec',
+           'split_extension']
+
+
+class Codec(object):
+
+    """Compression format of the data files.
+
+    The streams are opened with an opener callable with the signature
+    opener(filename, open_mode, level, block_size, workers) that
+    returns a file-like object.
+    """
+
+    def __init__(self, name: str, extension: str, opener, default_level: int = None, splittable: bool = False):
+        """Describe a compression format.
+
+        Args:
+            name (str): the codec name
+            extension (str): the file extension, for example ".gz"
+            opener (callable): the function that opens the streams
+            default_level (int): the compression level used when
+                                 none is requested
+            splittable (bool): a record can be found from any byte
+                               position of the file (no compression)
+
+        Returns:
+            Codec: the instance of this object
+
+        """
+        self.name = name
+        self.extension = extension
+        self.default_level = default_level
+        self.splittable = splittable
+        self.__opener = opener
+
+    def open(self, filename: str, open_mode: str = 'rb', level: int = None, block_size: int = None, workers: int = 1):
+        """Open a stream of the codec.
+
+        Args:
+            filename (str): the file to open
+            open_mode (str): the mode with which open the file
+            level (int): the compression level, None for the default one
+            block_size (int): block size of the codecs that support it
+            workers (int): number of compression threads, for the
+                           codecs that support it
+
+        Returns:
+            file_descriptor
+
+        """
+        if level is None:
+            level = self.default_level
+        return self.__opener(filename, open_mode, level, block_size, workers)
+
+
+class ZstdFile(object):
+
+    """Zstandard file that seeks like gzip.GzipFile.
+
+    Backward seeks restart the decompression from the start of the
+    file and seeks from the end are not supported.
+    """
+
+    def __init__(self, filename: str, mode: str = 'rb', level: int = 3):
+        """Open a zstandard file.
+
+        Args:
+            filename (str): the file to open
+            mode (str): 'rb', 'wb' or 'ab'
+            level (int): the compression level
+
+        Returns:
+            ZstdFile: the instance of this object
+
+        """
+        assert mode in ['rb', 'wb', 'ab'], "Mode '{}' not supported...".format(mode)
+        self.__filename = filename
+        self.__mode = mode
+        self.__level = level
+        self.__descriptor = None
+        self.__position = 0
+        self.__open()
+
+    def __open(self):
+        """Open the stream from the start of the file."""
+        if self.__mode == 'rb':
+            self.__descriptor = zstandard.open(self.__filename, 'rb')
+        else:
+            self.__descriptor = zstandard.open(
+                self.__filename, self.__mode,
+                cctx=zstandard.ZstdCompressor(level=self.__level))
+        self.__position = 0
+
+    @property
+    def closed(self) -> bool:
+        return self.__descriptor.closed
+
+    def tell(self) -> int:
+        """Get the position in the decompressed stream."""
+        return self.__position
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        """Move to a position in the decompressed stream.
+
+        Args:
+            pos (int): the position
+            whence (int): 0 from the start or 1 from the current position
+
+        Returns:
+            int: the new position
+
+        """
+        if self.__mode != 'rb':
+            raise Exception("Seek is supported only in read mode...")
+        if whence == 1:
+            pos += self.__position
+        elif whence != 0:
+            raise Exception("Seek from end not supported...")
+        if pos < self.__position:
+            self.__descriptor.close()
+            self.__open()
+        if pos > self.__position:
+            self.__position = self.__descriptor.seek(pos)
+        return self.__position
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.__descriptor.read(size)
+        self.__position += len(data)
+        return data
+
+    def write(self, data: bytes) -> int:
+        self.__descriptor.write(data)
+        self.__position += len(data)
+        return len(data)
+
+    def flush(self):
+        self.__descriptor.flush()
+
+    def close(self):
+        """Close the file."""
+        if self.__descriptor is not None and not self.__descriptor.closed:
+            self.__descriptor.close()
+
+    def __del__(self):
+        """Object destructor."""
+        self.close()
+
+
+def _open_raw(filename, open_mode, level, block_size, workers):
+    return open(filename, mode=open_mode)
+
+
+def _open_gzip(filename, open_mode, level, block_size, workers):
+    """Open a gzip stream.
+
+    Gzip files with a block table (see datafile.bgzf) are opened with
+    the seekable block reader. The block writer is used when a
+    block_size is given, when the compression uses more than one
+    worker or when appending to a block gzip file.
+    """
+    if open_mode == 'rb' and path.isfile(blocks_path(filename)):
+        return BlockGzipReader(filename)
+    elif open_mode == 'ab' and path.isfile(blocks_path(filename)):
+        return BlockGzipWriter(
+            filename, open_mode, block_size or BLOCK_SIZE, level, workers)
+    elif (block_size or workers > 1) and (open_mode == 'wb' or not path.isfile(filename)):
+        return BlockGzipWriter(
+            filename, open_mode, block_size or BLOCK_SIZE, level, workers)
+    if open_mode != 'rb':
+        remove_blocks(filename)
+    return gzip.GzipFile(filename, mode=open_mode, compresslevel=level)
+
+
+def _open_bz2(filename, open_mode, level, block_size, workers):
+    return bz2.BZ2File(filename, mode=open_mode, compresslevel=level)
+
+
+def _open_lzma(filename, open_mode, level, block_size, workers):
+    # The preset is accepted only when compressing
+    return lzma.LZMAFile(
+        filename, mode=open_mode, preset=level if open_mode != 'rb' else None)
+
+
+def _open_zstd(filename, open_mode, level, block_size, workers):
+    return ZstdFile(filename, open_mode, level)
+
+
+def _open_lz4(filename, open_mode, level, block_size, workers):
+    return lz4_frame.LZ4FrameFile(
+        filename, mode=open_mode, compression_level=level)
+
+
+CODECS = {}
+
+RAW = Codec('raw', '', _open_raw, splittable=True)
+
+
+def register_codec(codec: 'Codec'):
+    """Make a codec available for the files with its extension.
+
+    Args:
+        codec (Codec): the codec to register
+
+    """
+    CODECS[codec.extension] = codec
+
+
+def split_extension(filename: str):
+    """Split the data format and the codec of a filename.
+
+    Args:
+        filename (str): the file name, for example "data.json.gz"
+
+    Returns:
+        tuple: (str, Codec) the format extension (".json") and the
+               codec of the file (RAW for uncompressed files)
+
+    """
+    body, ext = path.splitext(filename)
+    if ext in CODECS:
+        return path.splitext(body)[1], CODECS[ext]
+    return ext, RAW
+
+
+register_codec(Codec('gzip', '.gz', _open_gzip, default_level=9))
+register_codec(Codec('bz2', '.bz2', _open_bz2, default_level=9))
+register_codec(Codec('lzma', '.xz', _open_lzma, default_level=6))
+
+if zstandard is not None:
+    register_codec(Codec('zstd', '.zst', _open_zstd, default_level=3))
+
+if lz4_frame is not None:
+    register_codec(Codec('lz4', '.lz4', _open_lz4,
+                         default_level=lz4_frame.COMPRESSIONLEVEL_MIN))
@@ -0,0 +1,176 @@
+import json
+import mmap
+from array import array
+from os import path, remove
+
+__all__ = ['OffsetIndex', 'count_path', 'index_path', 'read_count',
+           'remove_count', 'remove_index', 'write_count', 'write_index']
+
+
+def index_path(filename: str) -> str:
+    """Get the sidecar index filename of a data file.
+
+    Args:
+        filename (str): the data file name
+
+    Returns:
+        str: the index file name
+
+    """
+    return "{}.idx".format(filename)
+
+
+def write_index(filename: str, offsets) -> str:
+    """Write the record offsets of a data file in its sidecar index.
+
+    The index is a flat array of unsigned 64 bit integers (native byte
+    order), one for each record, with the position of the record start
+    in the decompressed stream.
+
+    Args:
+        filename (str): the data file name
+        offsets (iterable(int)): the record start offsets
+
+    Returns:
+        str: the index file name
+
+    """
+    if not isinstance(offsets, array):
+        offsets = array('Q', offsets)
+    idx_filename = index_path(filename)
+    with open(idx_filename, 'wb') as idx_file:
+        offsets.tofile(idx_file)
+    return idx_filename
+
+
+def remove_index(filename: str):
+    """Remove the sidecar index of a data file, if any."""
+    idx_filename = index_path(filename)
+    if path.isfile(idx_filename):
+        remove(idx_filename)
+
+
+def count_path(filename: str) -> str:
+    """Get the sidecar record count filename of a data file.
+
+    Args:
+        filename (str): the data file name
+
+    Returns:
+        str: the record count file name
+
+    """
+    return "{}.count".format(filename)
+
+
+def write_count(filename: str, records: int, size: int) -> str:
+    """Write the number of records and bytes of a data file in its sidecar.
+
+    The sidecar keeps also the current size of the data file, to
+    detect a later change of the file (see read_count).
+
+    Args:
+        filename (str): the data file name
+        records (int): the number of records
+        size (int): the size of the decompressed stream
+
+    Returns:
+        str: the record count file name
+
+    """
+    count_filename = count_path(filename)
+    with open(count_filename, 'w') as count_file:
+        json.dump({
+            'records': records,
+            'bytes': size,
+            'file_bytes': path.getsize(filename)
+        }, count_file)
+    return count_filename
+
+
+def read_count(filename: str):
+    """Read the record count sidecar of a data file.
+
+    Args:
+        filename (str): the data file name
+
+    Returns:
+        tuple: (int, int) the number of records and the size of the
+               decompressed stream, or None if there is no sidecar or
+               if the data file size is not the one of the sidecar
+
+    """
+    count_filename = count_path(filename)
+    if not path.isfile(count_filename) or not path.isfile(filename):
+        return None
+    with open(count_filename) as count_file:
+        count = json.load(count_file)
+    if count.get('file_bytes') != path.getsize(filename):
+        # The data file was changed without the writer
+        return None
+    return count['records'], count['bytes']
+
+
+def remove_count(filename: str):
+    """Remove the record count sidecar of a data file, if any."""
+    count_filename = count_path(filename)
+    if path.isfile(count_filename):
+        remove(count_filename)
+
+
+class OffsetIndex(object):
+
+    """Memory-mapped view of a sidecar index."""
+
+    def __init__(self, filename: str):
+        """Load the sidecar index of a data file.
+
+        Args:
+            filename (str): the data file name (not the index one)
+
+        Returns:
+            OffsetIndex: the instance of this object
+
+        """
+        self.__file = open(index_path(filename), 'rb')
+        self.__map = None
+        self.__offsets = []
+        if path.getsize(index_path(filename)) > 0:
+            self.__map = mmap.mmap(
+                self.__file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.__offsets = memoryview(self.__map).cast('Q')
+
+    @staticmethod
+    def exists(filename: str) -> bool:
+        """Check if a data file has a sidecar index."""
+        return path.isfile(index_path(filename))
+
+    def __len__(self):
+        return len(self.__offsets)
+
+    def __getitem__(self, idx: int) -> int:
+        """Get the start offset of a record.
+
+        Args:
+            idx (int): the record index, negative values start from the end
+
+        Returns:
+            int: the record start offset
+
+        """
+        return self.__offsets[idx]
+
+    def close(self):
+        """Release the mapping and the index file."""
+        if isinstance(self.__offsets, memoryview):
+            self.__offsets.release()
+            self.__offsets = []
+        if self.__map is not None:
+            self.__map.close()
+            self.__map = None
+        if not self.__file.closed:
+            self.__file.close()
+
+    def __del__(self):
+        """Object destructor."""
+        self.close()
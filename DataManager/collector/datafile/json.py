@@ -1,23 +1,131 @@
 import json
-from io import IOBase
+import mmap
+from array import array
+from bisect import bisect_right, insort
+from io import BytesIO, IOBase
+from math import isfinite
+from multiprocessing import Pool, cpu_count
+from os import path
 from string import whitespace
 from types import GeneratorType
 
-from .utils import gen_increasing_slice, get_or_create_descriptor
+from .codec import split_extension
+from .index import (OffsetIndex, read_count, remove_count, remove_index,
+                    write_count, write_index)
+from .utils import (FileView, get_or_create_descriptor, get_slice_indexes,
+                    is_plain_file)
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
 __all__ = ['JSONDataFileReader', 'JSONDataFileWriter']
 
 
+def _has_non_finite(obj) -> bool:
+    """Check if an object contains NaN or infinite floats."""
+    if isinstance(obj, float):
+        return not isfinite(obj)
+    elif isinstance(obj, dict):
+        return any(_has_non_finite(value) for value in obj.values())
+    elif isinstance(obj, (list, tuple)):
+        return any(_has_non_finite(value) for value in obj)
+    return False
+
+
+def encode_json(obj) -> bytes:
+    """Serialize an object to UTF-8 JSON.
+
+    Note:
+        orjson is used when it is installed, objects that it cannot
+        serialize fall back to the standard json module. orjson writes
+        NaN and infinite floats as null, so the objects that contain
+        them are also serialized with the json module (NaN, Infinity).
+
+    Args:
+        obj: the object to serialize
+
+    Returns:
+        bytes: the JSON string
+
+    """
+    if orjson is not None:
+        try:
+            data = orjson.dumps(obj, option=orjson.OPT_NON_STR_KEYS)
+            if b'null' not in data or not _has_non_finite(obj):
+                return data
+        except TypeError:
+            pass
+    return json.dumps(obj).encode("utf-8")
+
+
+def decode_json(data):
+    """Deserialize a UTF-8 JSON string.
+
+    Note:
+        orjson is used when it is installed, it also parses memoryview
+        slices without copying them. Values that it cannot parse (for
+        example integers bigger than 64 bit) fall back to the standard
+        json module.
+
+    Args:
+        data (bytes or memoryview): the JSON string
+
+    Returns:
+        the deserialized object
+
+    """
+    if orjson is not None:
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            pass
+    return json.loads(bytes(data))
+
+
+def read_range(args):
+    """Decode the records of a file range.
+
+    Note: this is the worker function of JSONDataFileReader.iter_parallel.
+
+    Args:
+        args (tuple): (filename, start, stop, use_mmap) the file, the
+                      range of record start positions to decode and
+                      the reader mode
+
+    Returns:
+        list(dict): the decoded records
+    """
+    filename, start, stop, use_mmap = args
+    with JSONDataFileReader(filename, index=False, use_mmap=use_mmap) as reader:
+        return list(reader.iter_range(start, stop))
+
+
 class JSONDataFileWriter(object):
 
     """Write json.gz file."""
 
-    def __init__(self, filename: str = None, descriptor: 'IOBase' = None, data=None, append: bool = False):
+    def __init__(self, filename: str = None, descriptor: 'IOBase' = None, data=None, append: bool = False, index: bool = False, block_size: int = None, compression_level: int = None, workers: int = 1):
         """Init function of data writer for json.gz files.
 
         Args:
             filename (str): name of the json.gz file to write.
             data (str, dict, list(str), list(dict)): initial data to be inserted
+            index (bool): write the record offsets in a sidecar index
+                          (filename + ".idx") when the writer is closed
+            block_size (int): write a .json.gz file as independent gzip
+                              members of block_size decompressed bytes,
+                              with a sidecar block table for fast seeks
+            compression_level (int): the compression level, None for
+                                     the default of the file codec
+            workers (int): compress the gzip members on a pool of
+                           worker threads (implies block gzip output)
+
+        Note:
+            When a filename is given, the number of records and bytes
+            are written in a sidecar (filename + ".count") when the
+            writer is closed.
 
         Returns:
             JSONDataFileWriter: the instance of this object
@@ -25,19 +133,42 @@ class JSONDataFileWriter(object):
         """
         assert any([filename is not None, descriptor is not None]
                    ), "You have to specify a filename or a descriptor..."
+        assert not index or filename is not None, "The sidecar index needs a filename..."
         self.__filename = filename
         self.__descriptor = descriptor
+        self.__index = index
+        self.__offsets = array('Q')
+        self.__position = None
+        self.__len = None
+        append_to_file = append and filename is not None and path.isfile(filename)
+        if append_to_file:
+            count = read_count(filename)
+            if index:
+                with JSONDataFileReader(filename, index=False) as reader:
+                    self.__offsets, self.__position = reader.scan_offsets()
+                self.__len = len(self.__offsets)
+            elif count is not None:
+                self.__len, self.__position = count
+        else:
+            self.__len = 0
+        if filename is not None:
+            # Old sidecars do not match the new content
+            if not (index and append_to_file):
+                remove_index(filename)
+            remove_count(filename)
         if not self.__descriptor:
-            if append:
-                self.__descriptor = get_or_create_descriptor(
-                    self.__filename, "ab")
-            else:
-                self.__descriptor = get_or_create_descriptor(
-                    self.__filename, "wb")
+            self.__descriptor = get_or_create_descriptor(
+                self.__filename, "ab" if append else "wb",
+                block_size=block_size, level=compression_level, workers=workers)
 
-        if append:
+        if append and descriptor is not None:
             self.__descriptor.seek(0, 2)
 
+        if self.__position is None:
+            if hasattr(self.__descriptor, 'num_records'):
+                self.__len = self.__descriptor.num_records
+            self.__position = self.__descriptor.tell()
+
         if data is not None:
             self.append(data)
 
@@ -57,24 +188,77 @@ class JSONDataFileWriter(object):
         except ValueError:
             return False
         else:
-            return json.dumps(obj)
+            return encode_json(obj)
 
     @property
     def raw_data(self):
         self.__descriptor.seek(0, 0)
         return self.__descriptor.read()
 
-    def __write(self, data):
-        """Write data to the json.gz file.
+    def view(self):
+        """Get a read-only stream of the data written so far.
+
+        Uncompressed outputs are shared with a FileView, without
+        reading them in memory, the others are copied in a BytesIO.
+
+        Returns:
+            file_descriptor: the stream of the written data
+
+        """
+        self.__descriptor.flush()
+        if is_plain_file(self.__descriptor) and (
+                self.__filename is None or split_extension(self.__filename)[1].splittable):
+            return FileView(self.__descriptor.fileno())
+        return BytesIO(self.raw_data)
+
+    @property
+    def position(self) -> int:
+        """Position of the next record in the decompressed stream."""
+        return self.__position
+
+    def __write(self, lines):
+        """Write encoded records to the json.gz file with a single write.
 
         Args:
-            data (str): the JSON string to write
+            lines (list(bytes)): the JSON strings to write, without newline
 
         Returns:
-            JSONDataFileWriter: this object instance
+            int: the number of bytes written
+
+        """
+        if self.__index:
+            position = self.__position
+            for line in lines:
+                self.__offsets.append(position)
+                position += len(line) + 1
+        data = b'\n'.join(lines) + b'\n'
+        self.__position += len(data)
+        if self.__len is not None:
+            self.__len += len(lines)
+        return self.__descriptor.write(data)
+
+    def __encode(self, data, validate: bool = True) -> bytes:
+        """Encode a record.
+
+        Args:
+            data (str or dict): a JSON string or a dictionary
+            validate (bool): check (and normalize) JSON strings
+
+        Returns:
+            bytes: the encoded JSON string
 
         """
-        return self.__descriptor.write(data.encode("utf-8") + b'\n')
+        if isinstance(data, dict):
+            return encode_json(data)
+        elif isinstance(data, str):
+            if not validate:
+                return data.encode("utf-8")
+            valid_json = self.__valid_json(data)
+            if valid_json:
+                return valid_json
+        raise Exception(
+            "You can pass only a list of 'dict' or JSON strings"
+        )
 
     def append(self, data):
         """Append data to the json.gz file.
@@ -86,32 +270,78 @@ class JSONDataFileWriter(object):
             JSONDataFileWriter: this object instance
 
         """
-        if isinstance(data, str):
-            return self.__write(self.__valid_json(data))
-        elif isinstance(data, dict):
-            return self.__write(json.dumps(data))
+        if isinstance(data, (str, dict)):
+            self.__write([self.__encode(data)])
         elif isinstance(data, (list, GeneratorType)):
-            for elm in data:
-                if isinstance(elm, dict):
-                    self.__write(json.dumps(elm))
-                else:
-                    valid_json = self.__valid_json(elm)
-                    if valid_json:
-                        self.__write(valid_json)
-                    else:
-                        raise Exception(
-                            "You can pass only a list of 'dict' or JSON strings"
-                        )
+            self.extend(data)
         else:
             raise Exception(
                 "'{}' is not a valid input data type".format(type(data)))
-        
+
         return self
 
-    def __del__(self):
-        """Object destructor."""
+    def extend(self, data, validate: bool = True):
+        """Append many records encoding them in a single buffer.
+
+        Args:
+            data (iterable(str or dict)): JSON strings or dictionaries
+            validate (bool): parse and serialize again the JSON strings,
+                             disable it for already serialized records
+
+        Returns:
+            JSONDataFileWriter: this object instance
+
+        """
+        lines = [self.__encode(elm, validate) for elm in data]
+        if lines:
+            self.__write(lines)
+        return self
+
+    def append_file(self, filename: str, records: int = None):
+        """Append the records of an uncompressed JSON file without decoding them.
+
+        Args:
+            filename (str): a file of newline terminated JSON strings,
+                            for example written by another process
+            records (int): the number of records of the file, counted
+                           when not given
+
+        Returns:
+            JSONDataFileWriter: this object instance
+
+        """
+        num_lines = 0
+        line_start = True
+        with open(filename, 'rb') as in_file:
+            for data in iter(lambda: in_file.read(1 << 20), b''):
+                if self.__index:
+                    if line_start:
+                        self.__offsets.append(self.__position)
+                    newline = data.find(b'\n')
+                    while -1 < newline < len(data) - 1:
+                        self.__offsets.append(self.__position + newline + 1)
+                        newline = data.find(b'\n', newline + 1)
+                    line_start = data.endswith(b'\n')
+                if records is None:
+                    num_lines += data.count(b'\n')
+                self.__descriptor.write(data)
+                self.__position += len(data)
+        if self.__len is not None:
+            self.__len += records if records is not None else num_lines
+        return self
+
+    def close(self):
+        """Close the file and write the sidecar index, if requested."""
         if not self.__descriptor.closed:
             self.__descriptor.close()
+            if self.__index:
+                write_index(self.__filename, self.__offsets)
+            if self.__filename is not None and self.__len is not None:
+                write_count(self.__filename, self.__len, self.__position)
+
+    def __del__(self):
+        """Object destructor."""
+        self.close()
 
     def __enter__(self):
         """Initialization for 'with' statement.
@@ -124,18 +354,26 @@ class JSONDataFileWriter(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Closing function for the 'with' statement."""
-        self.__descriptor.close()
+        self.close()
 
 
 class JSONDataFileReader(object):
 
     """Read json.gz file with easy access to data."""
 
-    def __init__(self, filename: str = None, descriptor: 'IOBase' = None):
+    def __init__(self, filename: str = None, descriptor: 'IOBase' = None, index: bool = True, block_size: int = 1 << 20, use_mmap: bool = False):
         """Init function of data reader for json.gz files.
 
         Args:
             filename (str): name of the json.gz file to open.
+            index (bool): use the sidecar index of the file, if it exists
+                          and the record count sidecar still matches
+                          the file
+            block_size (int): size of the decompressed blocks read by the
+                              line scanner
+            use_mmap (bool): map an uncompressed file in memory, the
+                             records are parsed from memoryview slices
+                             of the mapping (ignored for compressed files)
 
         Returns:
             JSONDataFileReader: the instance of this object
@@ -145,71 +383,306 @@ class JSONDataFileReader(object):
                    ), "You have to specify a filename or a descriptor..."
         self.__filename = filename
         self.__descriptor = descriptor
+        self.__map = None
+        self.__view = None
+        self.__use_mmap = False
         if not self.__descriptor:
-            self.__descriptor = get_or_create_descriptor(self.__filename)
+            if use_mmap and split_extension(filename)[1].splittable and path.getsize(filename) > 0:
+                with open(filename, 'rb') as map_file:
+                    self.__map = mmap.mmap(
+                        map_file.fileno(), 0, access=mmap.ACCESS_READ)
+                self.__view = memoryview(self.__map)
+                self.__descriptor = self.__map
+                self.__use_mmap = True
+            else:
+                self.__descriptor = get_or_create_descriptor(self.__filename)
         self.__last_index = 0
         self.__last_index_pos = 0
         self.__len = None
         self.__whitespaces = [elm.encode("utf-8") for elm in whitespace]
         self.__getitem_start = 0
         self.__checkpoints = {}
+        self.__checkpoint_indexes = []
+        self.__block_size = block_size
+        self.__buffer = b''
+        self.__buffer_start = 0
+        self.__buffer_offset = 0
+        self.__drop_buffer()
+        self.__index = None
+        count = read_count(filename) if filename is not None else None
+        if index and count is not None and OffsetIndex.exists(filename):
+            self.__index = OffsetIndex(filename)
+            if len(self.__index) != count[0]:
+                # The sidecar index is not the one of the current content
+                self.__index.close()
+                self.__index = None
+        if hasattr(self.__descriptor, 'num_records'):
+            self.__len = self.__descriptor.num_records
+        elif count is not None:
+            self.__len, _ = count
+        if hasattr(self.__descriptor, 'checkpoints'):
+            # Block gzip members start at record boundaries
+            for cur_index, pos in self.__descriptor.checkpoints():
+                self.add_checkpoint(cur_index, pos)
 
     @property
     def raw_data(self):
         self.__descriptor.seek(0, 0)
-        return self.__descriptor.read()
+        data = self.__descriptor.read()
+        self.__drop_buffer()
+        return data
+
+    def __drop_buffer(self):
+        """Discard the scanner block after a direct use of the descriptor."""
+        if self.__map is not None:
+            # The whole mapping is the scanner block
+            self.__buffer = self.__map
+            self.__buffer_start = 0
+            self.__buffer_offset = self.__map.tell()
+            self.__map.seek(0, 2)
+            return
+        self.__buffer = b''
+        self.__buffer_start = self.__descriptor.tell()
+        self.__buffer_offset = 0
+
+    def __seek(self, pos: int):
+        """Move the scanner cursor to a stream position.
+
+        The current block is reused if it contains the position,
+        otherwise the descriptor is moved and the block is discarded.
+
+        Args:
+            pos (int): the position in the decompressed stream
+
+        """
+        if self.__buffer_start <= pos <= self.__buffer_start + len(self.__buffer):
+            self.__buffer_offset = pos - self.__buffer_start
+        else:
+            self.__descriptor.seek(pos)
+            self.__drop_buffer()
+
+    def __tell(self) -> int:
+        """Get the stream position of the scanner cursor."""
+        return self.__buffer_start + self.__buffer_offset
+
+    def __fill(self) -> bool:
+        """Read the next block, carrying the partial line of the current one.
+
+        Returns:
+            bool: False if the stream is ended
+
+        """
+        block = self.__descriptor.read(self.__block_size)
+        if not block:
+            return False
+        self.__buffer_start += self.__buffer_offset
+        self.__buffer = self.__buffer[self.__buffer_offset:] + block
+        self.__buffer_offset = 0
+        return True
 
     def add_checkpoint(self, index: int, pos: int):
+        if index not in self.__checkpoints:
+            insort(self.__checkpoint_indexes, index)
         self.__checkpoints[index] = pos
 
     def __get_checkpoint(self, cur_index: int):
-        for index in reversed(sorted(self.__checkpoints)):
-            if cur_index > index:
-                return (index, self.__checkpoints[index])
-        return False
+        position = bisect_right(self.__checkpoint_indexes, cur_index)
+        if position == 0:
+            return False
+        index = self.__checkpoint_indexes[position - 1]
+        return (index, self.__checkpoints[index])
+
+    @property
+    def indexed(self) -> bool:
+        return self.__index is not None
+
+    def scan_offsets(self):
+        """Scan the whole file and collect the record start offsets.
+
+        Returns:
+            tuple: (array, int) the record start offsets and the
+                   position of the end of the stream
+
+        """
+        offsets = array('Q')
+        self.__seek(0)
+        for _, start in iter(self.__get_json, (None, -1)):
+            offsets.append(start)
+        return offsets, self.__tell()
+
+    def build_index(self):
+        """Create the sidecar index of the file with a one-time scan.
+
+        Returns:
+            JSONDataFileReader: this object instance
+
+        """
+        assert self.__filename is not None, "The sidecar index needs a filename..."
+        offsets, size = self.scan_offsets()
+        write_index(self.__filename, offsets)
+        write_count(self.__filename, len(offsets), size)
+        if self.__index is not None:
+            self.__index.close()
+        self.__index = OffsetIndex(self.__filename)
+        self.__len = len(self.__index)
+        return self
+
+    def __get_indexed(self, idx: int):
+        """Extract a JSON object with a single seek using the sidecar index.
+
+        Args:
+            idx (int): the object index, negative values start from the end
+
+        Returns:
+            dict: The JSON object converted in a dictionary
+
+        """
+        if idx < 0:
+            idx += len(self.__index)
+        if not 0 <= idx < len(self.__index):
+            raise IndexError
+        self.__seek(self.__index[idx])
+        obj, _ = self.__get_json()
+        return decode_json(obj)
 
     def __len__(self):
-        if not self.__len:
+        if self.__index is not None:
+            return len(self.__index)
+        if self.__len is None:
+            cur_pos = self.__tell()
             self.__descriptor.seek(0, 0)
-            num_lines = self.__descriptor.read().decode("utf-8").count('\n')
+            num_lines = 0
+            for block in iter(lambda: self.__descriptor.read(self.__block_size), b''):
+                num_lines += block.count(b'\n')
+            self.__drop_buffer()
+            self.__seek(cur_pos)
             self.__len = num_lines
         return self.__len
 
-    def __get_json_from_end(self, step: int = 1024):
-        buffer = b''
-        index = -step - 1
-        cur_chars = b''
-        while cur_chars.rfind(b'\n') == -1:
-            self.__descriptor.seek(index, 2)
-            last_pos = self.__descriptor.tell()
-            cur_chars = self.__descriptor.read(step)
-            buffer = cur_chars + buffer
-            index -= step
-        if len(buffer) >= 2:
-            return (
-                buffer[cur_chars.rfind(b'\n')+1:], last_pos +
-                cur_chars.rfind(b'\n')
-            )
-        else:
-            return (None, -1)
-
     def __get_json(self):
         """Extract a json object string from the file.
 
+        The stream is read in blocks of block_size bytes and the
+        records are split with bytes.find, a partial line at the end
+        of a block is carried to the next one. Empty lines are skipped
+        and an incomplete last line is discarded.
+
         Returns:
-            tuple: (dict, int) The JSON object converted in a
-                   dictionary and the position of that object
+            tuple: (bytes, int) The JSON object string (a memoryview
+                   with a mapped file) and the position of that object
                    in the file
 
         """
-        buffer = b''
-        start = self.__descriptor.tell()
-        for cur_char in iter(lambda: self.__descriptor.read(1), b''):
-            buffer += cur_char
-            if cur_char == b'\n' and len(buffer) >= 2:
-                return buffer, start
+        while True:
+            end = self.__buffer.find(b'\n', self.__buffer_offset)
+            if end == -1:
+                if not self.__fill():
+                    self.__buffer_offset = len(self.__buffer)
+                    return (None, -1)
+                continue
+            start = self.__buffer_offset
+            self.__buffer_offset = end + 1
+            if end > start:
+                if self.__view is not None:
+                    return self.__view[start:end], start
+                return self.__buffer[start:end], self.__buffer_start + start
+
+    @property
+    def filename(self) -> str:
+        return self.__filename
+
+    def iter_range(self, start: int, stop: int = None):
+        """Iterate the records that start in a range of positions.
+
+        Args:
+            start (int): a record start position
+            stop (int): the end of the range, None for the end of file
+
+        Returns:
+            generator: the JSON objects converted in dictionaries
+        """
+        self.__seek(start)
+        for json_obj, pos in iter(self.__get_json, (None, -1)):
+            if stop is not None and pos >= stop:
+                break
+            yield decode_json(json_obj)
+
+    def ranges(self, num_ranges: int):
+        """Split the file in ranges of records.
+
+        The boundaries come from the sidecar index, from the checkpoints
+        (block gzip members included) or, for uncompressed files, from
+        the first record after evenly spaced byte positions. Files that
+        cannot be read from any position without decompressing all the
+        data before it (for example plain gzip files) are returned as a
+        single range.
+
+        Args:
+            num_ranges (int): the maximum number of ranges
+
+        Returns:
+            list(tuple): the (start, stop) positions of each range,
+                         the last stop is None
+        """
+        boundaries = [0]
+        if self.__filename is None or not (
+                hasattr(self.__descriptor, 'checkpoints') or
+                split_extension(self.__filename)[1].splittable):
+            # Every worker would decompress the file from the start
+            pass
+        elif self.__index is not None:
+            num_records = len(self.__index)
+            boundaries += [
+                self.__index[cur * num_records // num_ranges]
+                for cur in range(1, num_ranges)
+            ]
+        elif self.__checkpoint_indexes:
+            positions = [
+                self.__checkpoints[index] for index in self.__checkpoint_indexes
+            ]
+            boundaries += [
+                positions[cur * len(positions) // num_ranges]
+                for cur in range(num_ranges)
+            ]
+        elif split_extension(self.__filename)[1].splittable:
+            size = path.getsize(self.__filename)
+            for cur in range(1, num_ranges):
+                # Skip the line that contains the split position
+                self.__seek(cur * size // num_ranges)
+                self.__get_json()
+                boundaries.append(self.__tell())
+        boundaries = sorted(set(boundaries))
+        return list(zip(boundaries, boundaries[1:] + [None]))
+
+    def iter_parallel(self, processes: int = cpu_count(), ordered: bool = True, ranges_per_process: int = 4):
+        """Decode the file with a pool of processes.
+
+        Each process decompresses and decodes a range of records (see
+        the ranges method), the file is opened again by every process.
+        A file that cannot be split is read in this process.
+
+        Args:
+            processes (int): the number of processes
+            ordered (bool): keep the records in the file order
+            ranges_per_process (int): number of ranges for each process
 
-        return (None, -1)
+        Returns:
+            generator: the JSON objects converted in dictionaries
+        """
+        assert self.__filename is not None, "Parallel reading needs a filename..."
+        ranges = self.ranges(processes * ranges_per_process)
+        if len(ranges) == 1:
+            yield from self.iter_range(*ranges[0])
+            return
+        tasks = [
+            (self.__filename, start, stop, self.__use_mmap)
+            for start, stop in ranges
+        ]
+        with Pool(processes) as pool:
+            mapper = pool.imap if ordered else pool.imap_unordered
+            for records in mapper(read_range, tasks):
+                for record in records:
+                    yield record
 
     def start_from(self, index: int, stop: int = -1):
         """Set the cursor to a specific object index to start.
@@ -219,88 +692,102 @@ class JSONDataFileReader(object):
         """
         if index < 0:
             raise Exception("Index have to be positive or equal to 0...")
-        self.__descriptor.seek(0, 0)
+        self.__seek(0)
         cur_idx = 0
 
-        checkpoint = self.__get_checkpoint(index)
-        if checkpoint != False:
-            self.__descriptor.seek(checkpoint[1])
-            cur_idx = checkpoint[0]
+        if self.__index is not None and index < len(self.__index):
+            self.__seek(self.__index[index])
+            cur_idx = index
+        else:
+            checkpoint = self.__get_checkpoint(index)
+            if checkpoint != False:
+                self.__seek(checkpoint[1])
+                cur_idx = checkpoint[0]
 
         for _ in range(index - cur_idx):
             _, _ = self.__get_json()
             cur_idx += 1
 
         for idx, (json_obj, _) in enumerate(iter(self.__get_json, (None, -1)), cur_idx):
-            if idx == stop - 1:
+            if idx == stop:
                 break
-            yield json.loads(json_obj, encoding="utf-8")
+            yield decode_json(json_obj)
 
-    def __getitem__(self, idx):
-        """Select an item or a group of item from the file.
+    def take(self, indices) -> list:
+        """Extract a group of objects with a single forward pass.
 
-        If the idx argument is a slice it is converted to a list
-        of indexes. All index lists will be processed in increasing
-        order (datafile.utils.gen_increasing_slice function for more details)
-        and then will be returned in the order requested by the user.
+        The indexes are visited in increasing order, each one starts
+        from the farthest checkpoint (or from the object reached by the
+        previous extraction) and only the skipped lines are scanned.
+        With the sidecar index every object costs a single seek.
 
         Args:
-            idx (int or slice): indexes to extract
+            indices (iterable(int)): the object indexes, negative
+                                     values start from the end
 
         Returns:
-            list or dict: The JSON object converted in a dictionary or a list
-                          of converted JSON objects
+            list(dict): the JSON objects converted in dictionaries,
+                        in the order of the indices
 
         """
-        assert isinstance(
-            idx, (int, slice)), "Index Could be an integer or a slice"
-
-        if isinstance(idx, int) and idx < 0:
-            for cur_index in range(-idx):
-                obj, pos = self.__get_json_from_end()
-                if -cur_index - 1 == idx:
-                    return json.loads(obj, encoding="utf-8")
+        indices = list(indices)
+        if any(idx < 0 for idx in indices):
+            num_records = len(self)
+            indices = [
+                idx + num_records if idx < 0 else idx for idx in indices]
+        if any(idx < 0 for idx in indices):
             raise IndexError
+        targets = sorted(set(indices))
+        results = {}
 
-        if isinstance(idx, slice):
-            to_extract = (elm for elm in gen_increasing_slice(idx))
-        else:
-            to_extract = [idx]
-
-        results = []
+        if self.__index is not None:
+            for target_idx in targets:
+                results[target_idx] = self.__get_indexed(target_idx)
+            return [results[idx] for idx in indices]
 
-        for target_idx in to_extract:
-            self.__descriptor.seek(0, 0)
-            cur_idx = 0
+        cur_idx, cur_pos = 0, 0
+        if targets and self.__last_index <= targets[0]:
+            cur_idx, cur_pos = self.__last_index, self.__last_index_pos
+        self.__seek(cur_pos)
 
+        for target_idx in targets:
             checkpoint = self.__get_checkpoint(target_idx)
-            if checkpoint != False:
-                self.__descriptor.seek(checkpoint[1])
+            if checkpoint != False and checkpoint[0] > cur_idx:
                 cur_idx = checkpoint[0]
-                self.__last_index = checkpoint[0]
-                self.__last_index_pos = checkpoint[1]
+                self.__seek(checkpoint[1])
+            while cur_idx <= target_idx:
+                json_obj, _ = self.__get_json()
+                if json_obj is None:
+                    self.__last_index, self.__last_index_pos = 0, 0
+                    raise IndexError
+                cur_idx += 1
+            results[target_idx] = decode_json(json_obj)
 
-            if self.__last_index > cur_idx and target_idx > self.__last_index:
-                self.__descriptor.seek(self.__last_index_pos)
-                cur_idx = self.__last_index
+        self.__last_index, self.__last_index_pos = cur_idx, self.__tell()
+        return [results[idx] for idx in indices]
 
-            for obj, start in iter(lambda: self.__get_json(), (None, -1)):
-                last_obj = obj
-                self.__last_index_pos = start
-                self.__last_index = cur_idx
+    def __getitem__(self, idx):
+        """Select an item or a group of item from the file.
 
-                if cur_idx == target_idx:
-                    results.append(json.loads(last_obj, encoding="utf-8"))
-                    break
+        If the idx argument is a slice it is converted to a list
+        of indexes (datafile.utils.get_slice_indexes function for more
+        details) that are extracted with a single pass (see take)
+        and then returned in the order requested by the user.
 
-                cur_idx += 1
+        Args:
+            idx (int or slice): indexes to extract
+
+        Returns:
+            list or dict: The JSON object converted in a dictionary or a list
+                          of converted JSON objects
+
+        """
+        assert isinstance(
+            idx, (int, slice)), "Index Could be an integer or a slice"
 
         if isinstance(idx, slice):
-            if idx.start is not None and idx.stop is not None and idx.start > idx.stop:
-                return list(reversed(results))
-            return results
-        else:
-            return results.pop(0)
+            return self.take(get_slice_indexes(idx, self.__len__))
+        return self.take([idx])[0]
 
     def __iter__(self):
         """Initialize the JSON reader iterator.
@@ -309,7 +796,7 @@ class JSONDataFileReader(object):
             JSONDataFileReader: this object instance
 
         """
-        self.__descriptor.seek(0, 0)
+        self.__seek(0)
         return self
 
     def __next__(self):
@@ -324,14 +811,28 @@ class JSONDataFileReader(object):
         """
         next_json, _ = self.__get_json()
         if next_json is not None:
-            return json.loads(next_json, encoding="utf-8")
+            return decode_json(next_json)
         else:
             raise StopIteration
 
+    def close(self):
+        """Close the file and its sidecar index."""
+        if self.__index is not None:
+            self.__index.close()
+        if self.__view is not None:
+            self.__view.release()
+            self.__view = None
+        if not self.__descriptor.closed:
+            try:
+                self.__descriptor.close()
+            except BufferError:
+                # Records still reference the mapping, it is
+                # released with the last of them
+                pass
+
     def __del__(self):
         """Object destructor."""
-        if not self.__descriptor.closed:
-            self.__descriptor.close()
+        self.close()
 
     def __enter__(self):
         """Initialization for 'with' statement.
@@ -344,7 +845,7 @@ class JSONDataFileReader(object):
 
     def __exit__(self, exc_type, exc_val, exc_tb):
         """Closing function for the 'with' statement."""
-        self.__descriptor.close()
+        self.close()
 
 
 if __name__ == "__main__":
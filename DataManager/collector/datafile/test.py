@@ -1,10 +1,23 @@
 import unittest
 import os
 import json
+import weakref
+from glob import glob
+from tempfile import TemporaryFile
+from unittest import mock
+
+
+def is_even(record):
+    return record["a"] % 2 == 0
 
 
 class TestConverters(unittest.TestCase):
 
+    def tearDown(self):
+        # Remove sidecar files left by the writers
+        for filename in glob("test.json*"):
+            os.remove(filename)
+
     def test_jsonDataFile_gz(self):
         from .json import JSONDataFileWriter, JSONDataFileReader
 
@@ -47,6 +60,522 @@ class TestConverters(unittest.TestCase):
 
         os.remove(FILENAME)
 
+    def test_jsonDataFile_index(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+        from .index import index_path
+
+        FILENAME = "test.json.gz"
+        with JSONDataFileWriter(FILENAME, data=[{"a": idx} for idx in range(10)], index=True):
+            pass
+
+        self.assertTrue(os.path.isfile(index_path(FILENAME)))
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 10)
+            self.assertEqual(data[3], {"a": 3})
+            self.assertEqual(data[-1], {"a": 9})
+            self.assertEqual(data[2:5], [{"a": 2}, {"a": 3}, {"a": 4}])
+            self.assertEqual(next(data.start_from(7)), {"a": 7})
+
+        with JSONDataFileWriter(FILENAME, data=[{"a": 10}], append=True, index=True):
+            pass
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 11)
+            self.assertEqual(data[10], {"a": 10})
+
+        os.remove(index_path(FILENAME))
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertFalse(data.indexed)
+            data.build_index()
+            self.assertEqual(data[-2], {"a": 9})
+
+        os.remove(index_path(FILENAME))
+        os.remove(FILENAME)
+
+    def test_jsonDataFile_take(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+
+        FILENAME = "test.json.gz"
+        with JSONDataFileWriter(FILENAME, data=[{"a": idx} for idx in range(20)]):
+            pass
+
+        for index in [False, True]:
+            with JSONDataFileReader(FILENAME) as data:
+                if index:
+                    data.build_index()
+                self.assertEqual(data.take([7, 2, -1, 2]), [
+                                 {"a": 7}, {"a": 2}, {"a": 19}, {"a": 2}])
+                self.assertEqual(data[17:], [{"a": 17}, {"a": 18}, {"a": 19}])
+                self.assertEqual(data[-2:], [{"a": 18}, {"a": 19}])
+                self.assertEqual(data[4:1], [{"a": 4}, {"a": 3}, {"a": 2}])
+                self.assertEqual(data[3], {"a": 3})
+                self.assertEqual(data[1], {"a": 1})
+                with self.assertRaises(IndexError):
+                    data.take([3, 20])
+
+    def test_jsonDataFile_codecs(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+        from .codec import CODECS
+
+        for extension in ['', *CODECS]:
+            FILENAME = "test.json{}".format(extension)
+            with JSONDataFileWriter(FILENAME, data=[{"a": idx} for idx in range(10)], compression_level=1):
+                pass
+            with JSONDataFileWriter(FILENAME, data=[{"a": 10}], append=True):
+                pass
+            with JSONDataFileReader(FILENAME) as data:
+                self.assertEqual(len(data), 11)
+                self.assertEqual(data[7], {"a": 7})
+                self.assertEqual(data[2], {"a": 2})
+                self.assertEqual(list(data)[-1], {"a": 10})
+
+    def test_dataFile_mmap(self):
+        from .json import JSONDataFileWriter
+        from .avro import AvroDataFileWriter
+        from ..api import DataFile
+
+        records = [{"a": idx, "b": "x" * idx} for idx in range(100)]
+        for FILENAME, Writer in [("test.json", JSONDataFileWriter), ("test.avro", AvroDataFileWriter)]:
+            with Writer(FILENAME, data=records):
+                pass
+            data = DataFile(FILENAME, use_mmap=True)
+            self.assertEqual(len(data), 100)
+            self.assertEqual(list(data), records)
+            self.assertEqual(data.take([42, 7]), [records[42], records[7]])
+            self.assertEqual(list(data.get_data_parallel(2)), records)
+            del data
+            os.remove(FILENAME)
+
+    def test_dataFile_writer_view(self):
+        from tempfile import NamedTemporaryFile
+        from .json import JSONDataFileWriter
+        from .utils import FileView
+        from ..api import DataFile
+
+        with NamedTemporaryFile() as tmp_file:
+            writer = JSONDataFileWriter(
+                descriptor=tmp_file, data=[{"a": idx} for idx in range(10)])
+            view = writer.view()
+            self.assertIsInstance(view, FileView)
+            data = DataFile(writer)
+            self.assertEqual(len(data), 10)
+            writer.append({"a": 10})
+            self.assertEqual(list(DataFile(writer))[-1], {"a": 10})
+            view.close()
+
+    def test_dataFile_batches(self):
+        from .json import JSONDataFileWriter
+        from ..api import DataFile
+
+        FILENAME = "test.json"
+        with JSONDataFileWriter(FILENAME, data=[
+                {"a": idx, "b": idx / 2, "c": str(idx)} for idx in range(10)]):
+            pass
+
+        data = DataFile(FILENAME)
+        batches = list(data.get_batches(4, columns=["a", "c", "d"]))
+        self.assertEqual([len(batch["a"]) for batch in batches], [4, 4, 2])
+        self.assertEqual(batches[0]["a"].tolist(), [0, 1, 2, 3])
+        self.assertEqual(batches[2]["c"], ["8", "9"])
+        self.assertEqual(batches[1]["d"], [None] * 4)
+        self.assertEqual(next(data.get_batches(10))["b"].sum(), 22.5)
+        self.assertEqual([len(chunk) for chunk in data.get_chunks(4)], [4, 4, 2])
+
+    def test_dataFile_prefetch(self):
+        from .json import JSONDataFileWriter
+        from .utils import iter_prefetch
+        from ..api import DataFile
+
+        FILENAME = "test.json"
+        with JSONDataFileWriter(FILENAME, data=[{"a": idx} for idx in range(10)]):
+            pass
+
+        data = DataFile(FILENAME)
+        self.assertEqual(list(data.get_data_prefetch(2, chunk_size=3)),
+                         [{"a": idx} for idx in range(10)])
+
+        records = iter_prefetch(iter(range(100)), 1, chunk_size=4)
+        self.assertEqual(next(records), 0)
+        records.close()
+
+        def failing():
+            yield 1
+            raise ValueError("broken record")
+
+        with self.assertRaises(ValueError):
+            list(iter_prefetch(failing()))
+
+    def test_partitionedDataFile(self):
+        from shutil import rmtree
+        from .json import JSONDataFileWriter
+        from ..api import PartitionedDataFile
+
+        BASE_PATH = "test_partitions"
+        dates = [(2018, 5, 30), (2018, 5, 31), (2018, 6, 1)]
+        for num, (year, month, day) in enumerate(dates):
+            day_path = os.path.join(BASE_PATH, "year={}".format(year),
+                                    "month={}".format(month), "day={}".format(day))
+            os.makedirs(day_path)
+            with JSONDataFileWriter(os.path.join(day_path, "part-m-00000.json"), data=[
+                    {"day": day, "idx": idx} for idx in range(num + 2)]):
+                pass
+
+        data = PartitionedDataFile(
+            BASE_PATH, dates + [(2018, 6, 2)], pattern="part-*.json")
+        self.assertEqual(len(data.partitions), 3)
+        self.assertEqual(len(data), 9)
+        self.assertEqual(len(list(data)), 9)
+        self.assertEqual(data.locate(4), (1, 2))
+        self.assertEqual(data[4], {"day": 31, "idx": 2})
+        self.assertEqual(data[-1], {"day": 1, "idx": 3})
+        self.assertEqual(data.take([5, 0, 2]), [
+                         {"day": 1, "idx": 0}, {"day": 30, "idx": 0}, {"day": 31, "idx": 0}])
+        self.assertEqual([len(part) for part in data.iter_partitions()], [2, 3, 4])
+        self.assertEqual(data.missing_dates, [(2018, 6, 2)])
+
+        # The iteration does not keep the partitions open
+        data = PartitionedDataFile(BASE_PATH, dates, pattern="part-*.json")
+        partitions = [weakref.ref(part) for part in data.iter_partitions()]
+        self.assertEqual(len(list(data)), 9)
+        self.assertEqual([part() for part in partitions], [None] * 3)
+
+        rmtree(BASE_PATH)
+
+    def test_jsonDataFile_block_scan(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+
+        FILENAME = "test.json"
+        records = [{"a": "x" * idx} for idx in range(20)]
+        with JSONDataFileWriter(FILENAME, data=records):
+            pass
+
+        # Blocks smaller than the records force the partial line carry
+        with JSONDataFileReader(FILENAME, block_size=7) as data:
+            self.assertEqual(list(data), records)
+            self.assertEqual(data[12], records[12])
+            self.assertEqual(data[3:6], records[3:6])
+            offsets, end = data.scan_offsets()
+            self.assertEqual(end, os.path.getsize(FILENAME))
+            data.add_checkpoint(10, offsets[10])
+            self.assertEqual(data[15], records[15])
+            self.assertEqual(next(data.start_from(11)), records[11])
+
+        os.remove(FILENAME)
+
+    def test_jsonDataFile_block_gz(self):
+        import gzip
+        from .json import JSONDataFileWriter, JSONDataFileReader
+        from .bgzf import blocks_path
+
+        FILENAME = "test.json.gz"
+        records = [{"a": idx} for idx in range(100)]
+        with JSONDataFileWriter(FILENAME, data=records[:60], block_size=64):
+            pass
+        with JSONDataFileWriter(FILENAME, data=records[60:], append=True):
+            pass
+
+        # Readable by plain gzip tools
+        with gzip.open(FILENAME, 'rb') as data:
+            self.assertEqual(
+                [json.loads(line) for line in data.read().splitlines()], records)
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertIsInstance(data.raw_data, bytes)
+            self.assertEqual(data[77], records[77])
+            self.assertEqual(data[5], records[5])
+            self.assertEqual(list(data.start_from(98)), records[98:])
+            self.assertEqual(list(data.start_from(10, 14)), records[10:14])
+            self.assertEqual(list(data), records)
+
+        # A plain rewrite drops the stale block table
+        with JSONDataFileWriter(FILENAME, data=records[:3]):
+            pass
+        self.assertFalse(os.path.isfile(blocks_path(FILENAME)))
+
+        os.remove(FILENAME)
+
+    def test_jsonDataFile_block_gz_workers(self):
+        import gzip
+        from .json import JSONDataFileWriter, JSONDataFileReader
+        from .bgzf import blocks_path
+        from .index import index_path
+
+        FILENAME = "test.json.gz"
+        records = [{"a": idx, "b": "x" * (idx % 7)} for idx in range(500)]
+        with JSONDataFileWriter(FILENAME, data=records, index=True,
+                                block_size=256, workers=4):
+            pass
+        self.assertTrue(os.path.isfile(blocks_path(FILENAME)))
+        self.assertTrue(os.path.isfile(index_path(FILENAME)))
+
+        with gzip.open(FILENAME, 'rb') as data:
+            self.assertEqual(
+                [json.loads(line) for line in data.read().splitlines()], records)
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 500)
+            self.assertEqual(data[321], records[321])
+            self.assertEqual(data.take([499, 0, 250]),
+                             [records[499], records[0], records[250]])
+            self.assertEqual(list(data), records)
+
+    def test_jsonDataFile_count(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+        from .index import count_path, read_count
+
+        FILENAME = "test.json.gz"
+        with JSONDataFileWriter(FILENAME, data=[{"a": idx} for idx in range(10)]):
+            pass
+        self.assertEqual(read_count(FILENAME)[0], 10)
+
+        with JSONDataFileWriter(FILENAME, data=[{"a": 10}], append=True):
+            pass
+        self.assertEqual(read_count(FILENAME)[0], 11)
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 11)
+
+        # Fallback to the streaming count
+        os.remove(count_path(FILENAME))
+        with JSONDataFileReader(FILENAME, block_size=16) as data:
+            self.assertEqual(len(data), 11)
+            self.assertEqual(len(list(data)), 11)
+            self.assertEqual(data[-1], {"a": 10})
+
+        # A change outside the writer makes the sidecars stale
+        with JSONDataFileWriter("test.json", data=[{"a": idx} for idx in range(10)], index=True):
+            pass
+        with open("test.json", 'ab') as data_file:
+            data_file.write(b'{"a": 10}\n')
+        self.assertIsNone(read_count("test.json"))
+        with JSONDataFileReader("test.json") as data:
+            self.assertEqual(len(data), 11)
+            self.assertEqual(data[10], {"a": 10})
+        with JSONDataFileReader("test.json") as data:
+            data.build_index()
+        self.assertEqual(read_count("test.json")[0], 11)
+        with JSONDataFileReader("test.json") as data:
+            self.assertEqual(len(data), 11)
+            self.assertEqual(data[10], {"a": 10})
+        for filename in ["test.json", "test.json.idx", "test.json.count"]:
+            os.remove(filename)
+
+        os.remove(FILENAME)
+
+    def test_avroDataFile_len(self):
+        from fastavro import writer, parse_schema
+        from .avro import AvroDataFileReader
+
+        FILENAME = "test.avro"
+        schema = parse_schema({
+            'type': "record",
+            'name': "test",
+            'fields': [{'name': "a", 'type': "long"}]
+        })
+        with open(FILENAME, 'wb') as avro_file:
+            writer(avro_file, schema, [{"a": idx}
+                                       for idx in range(1000)], sync_interval=64)
+
+        with AvroDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 1000)
+            self.assertEqual(data[999], {"a": 999})
+            self.assertEqual(data[-1000], {"a": 0})
+            self.assertEqual(data.take([512, 3, 513]), [
+                             {"a": 512}, {"a": 3}, {"a": 513}])
+            self.assertEqual(data[998:], [{"a": 998}, {"a": 999}])
+            self.assertEqual(len(list(data)), 1000)
+            with self.assertRaises(IndexError):
+                data[1000]
+
+        os.remove(FILENAME)
+
+    def test_avroDataFile_projection(self):
+        from fastavro import writer, parse_schema
+        from .avro import AvroDataFileReader
+
+        FILENAME = "test.avro"
+        schema = parse_schema({
+            'type': "record",
+            'name': "test",
+            'fields': [
+                {'name': "a", 'type': "long"},
+                {'name': "b", 'type': "string"},
+                {'name': "c", 'type': {'type': "array", 'items': "double"}}
+            ]
+        })
+        with open(FILENAME, 'wb') as avro_file:
+            writer(avro_file, schema, [
+                {"a": idx, "b": str(idx % 2), "c": [0.5] * idx}
+                for idx in range(100)], sync_interval=64)
+
+        with AvroDataFileReader(FILENAME, fields=["a", "b"], predicate=lambda record: record["b"] == "1") as data:
+            self.assertEqual(len(data), 100)
+            self.assertEqual(data[10], {"a": 10, "b": "0"})
+            records = list(data)
+            self.assertEqual(len(records), 50)
+            self.assertEqual(records[0], {"a": 1, "b": "1"})
+
+        with self.assertRaises(Exception):
+            AvroDataFileReader(FILENAME, fields=["d"])
+
+        with AvroDataFileReader(FILENAME, fields=["a"], predicate=is_even) as data:
+            self.assertEqual(list(data.iter_parallel(2)), [
+                             {"a": idx} for idx in range(0, 100, 2)])
+
+        # A single block is read without a pool of processes
+        with open(FILENAME, 'wb') as avro_file:
+            writer(avro_file, schema, [
+                {"a": idx, "b": str(idx % 2), "c": []} for idx in range(10)])
+        with AvroDataFileReader(FILENAME, fields=["a"], predicate=is_even) as data:
+            with mock.patch("DataManager.collector.datafile.avro.Pool") as pool:
+                self.assertEqual(list(data.iter_parallel(2)), [
+                                 {"a": idx} for idx in range(0, 10, 2)])
+            pool.assert_not_called()
+
+        os.remove(FILENAME)
+
+    def test_avroDataFile_writer(self):
+        from .avro import AvroDataFileWriter, AvroDataFileReader
+        from ..api import DataFile
+
+        FILENAME = "test.avro"
+        records = [
+            {"a": idx, "b": {"c": idx / 2, "d": None if idx % 2 else "x"},
+             "e": [idx] * 3}
+            for idx in range(100)
+        ]
+        with AvroDataFileWriter(FILENAME, data=records[:10], sync_interval=64, schema_sample=20) as data:
+            data.extend([json.dumps(record) for record in records[10:]])
+            data.append(records[0])
+            self.assertEqual(len(data), 101)
+
+        with AvroDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 101)
+            self.assertEqual(data[99], records[99])
+            self.assertEqual(list(data)[:5], records[:5])
+
+        data = DataFile(AvroDataFileWriter(
+            descriptor=TemporaryFile(), data=records, codec='deflate'))
+        self.assertEqual(len(data), 100)
+        self.assertEqual(data[42], records[42])
+        self.assertEqual(list(data), records)
+
+        os.remove(FILENAME)
+
+    def test_avroDataFile_writer_drift(self):
+        from .avro import AvroDataFileWriter
+        from ..api import DataFile
+
+        records = [{"a": idx, "b": str(idx), "c": {"d": idx}} for idx in range(5)]
+        for drift in [
+            {"a": 2, "b": "x", "c": {"d": 1}, "e": 3},
+            {"a": 2, "b": "x", "c": {"d": 1, "f": 2}},
+            {"a": 2.5, "b": "x", "c": {"d": 1}},
+            {"a": 2, "b": None, "c": {"d": 1}},
+        ]:
+            data = AvroDataFileWriter(
+                descriptor=TemporaryFile(), data=records, schema_sample=5)
+            with self.assertRaises(Exception):
+                data.append(drift)
+            with self.assertRaises(Exception):
+                data.extend([json.dumps(drift)], validate=False)
+
+        # Drift inside the sample widens the inferred schema
+        data = AvroDataFileWriter(descriptor=TemporaryFile(), schema_sample=6)
+        data.extend(records[:2])
+        data.extend(records[2:] + [{"a": 1.5, "b": None, "c": {"d": 1}}])
+        self.assertEqual(list(DataFile(data))[-1], {"a": 1.5, "b": None, "c": {"d": 1}})
+
+    def test_avroDataFile_writer_empty(self):
+        from .avro import AvroDataFileWriter
+        from ..api import DataFile
+
+        data = DataFile(AvroDataFileWriter(descriptor=TemporaryFile()))
+        self.assertEqual(len(data), 0)
+        self.assertEqual(list(data), [])
+
+    def test_jsonDataFile_extend(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+
+        FILENAME = "test.json.gz"
+        with JSONDataFileWriter(FILENAME, index=True) as data:
+            data.extend([json.dumps({"a": idx}) for idx in range(5)], validate=False)
+            data.extend([{"a": 5}, '{"a": 6}'])
+            with self.assertRaises(Exception):
+                data.extend(["not a json"])
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 7)
+            self.assertEqual(list(data), [{"a": idx} for idx in range(7)])
+            self.assertEqual(data[5], {"a": 5})
+
+        os.remove(FILENAME)
+
+    def test_jsonDataFile_append_file(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+
+        FILENAME = "test.json.gz"
+        SHARD = "test.json.shard"
+        with open(SHARD, 'w') as shard:
+            shard.write("".join('{{"a": {}}}\n'.format(idx) for idx in range(1, 4)))
+
+        with JSONDataFileWriter(FILENAME, data=[{"a": 0}], index=True) as data:
+            data.append_file(SHARD)
+            data.append_file(SHARD, records=3)
+            data.append({"a": 4})
+
+        with JSONDataFileReader(FILENAME) as data:
+            self.assertEqual(len(data), 8)
+            self.assertEqual(data[3], {"a": 3})
+            self.assertEqual(data[5], {"a": 2})
+            self.assertEqual(data[-1], {"a": 4})
+
+    def test_jsonDataFile_non_finite(self):
+        from .json import JSONDataFileWriter, JSONDataFileReader
+
+        FILENAME = "test.json"
+        with JSONDataFileWriter(FILENAME) as data:
+            data.append({"x": float('nan'), "y": [float('inf'), None], "z": 1.5})
+            data.extend([{"x": -float('inf')}])
+
+        with JSONDataFileReader(FILENAME) as data:
+            records = list(data)
+        self.assertNotEqual(records[0]["x"], records[0]["x"])
+        self.assertEqual(records[0]["y"], [float('inf'), None])
+        self.assertEqual(records[0]["z"], 1.5)
+        self.assertEqual(records[1], {"x": -float('inf')})
+
+    def test_jsonDataFile_parallel(self):
+        from multiprocessing import Pool
+        from .json import JSONDataFileWriter, JSONDataFileReader
+
+        records = [{"a": idx} for idx in range(1000)]
+        for FILENAME, options, num_ranges in [
+            ("test.json", {}, 8),
+            ("test.json", {'index': True}, 8),
+            # Plain gzip files cannot be split without decompressing
+            ("test.json.gz", {'index': True}, 1),
+            ("test.json.gz", {'block_size': 256}, 8),
+        ]:
+            with JSONDataFileWriter(FILENAME, data=records, **options):
+                pass
+
+            with JSONDataFileReader(FILENAME) as data:
+                self.assertEqual(len(data.ranges(8)), num_ranges)
+                with mock.patch("DataManager.collector.datafile.json.Pool", wraps=Pool) as pool:
+                    self.assertEqual(list(data.iter_parallel(2)), records)
+                # A file that cannot be split is read in this process
+                self.assertEqual(pool.called, num_ranges > 1)
+                self.assertEqual(
+                    sorted(data.iter_parallel(2, ordered=False),
+                           key=lambda elm: elm["a"]),
+                    records
+                )
+
+            os.remove(FILENAME)
+
 
 if __name__ == '__main__':
     unittest.main()
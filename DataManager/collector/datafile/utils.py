@@ -1,9 +1,77 @@
 
-import gzip
-import bz2
-from os import path
+import io
+import os
+from queue import Full, Queue
+from threading import Event, Thread
 
-__all__ = ['gen_increasing_slice', 'get_or_create_descriptor']
+from .codec import split_extension
+
+__all__ = ['FileView', 'gen_increasing_slice', 'get_or_create_descriptor',
+           'get_slice_indexes', 'is_plain_file', 'iter_prefetch']
+
+
+def is_plain_file(descriptor) -> bool:
+    """Check if a stream writes its bytes as they are to an OS file."""
+    # Temporary files can be wrapped (tempfile._TemporaryFileWrapper)
+    descriptor = getattr(descriptor, 'file', descriptor)
+    return isinstance(descriptor, (io.BufferedRandom, io.BufferedWriter, io.FileIO))
+
+
+class FileView(io.RawIOBase):
+
+    """Read-only view of an open file with its own position.
+
+    The view reads with positional reads from a duplicate of the file
+    descriptor, so it neither moves the position of the original file
+    object nor copies its content in memory. Data written (and flushed)
+    to the original file after the creation of the view is visible.
+    """
+
+    def __init__(self, fileno: int):
+        """Create a view of an open file.
+
+        Args:
+            fileno (int): the OS file descriptor to share
+
+        Returns:
+            FileView: the instance of this object
+
+        """
+        super(FileView, self).__init__()
+        self.__fd = os.dup(fileno)
+        self.__pos = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        if hasattr(os, 'preadv'):
+            size = os.preadv(self.__fd, [buffer], self.__pos)
+        else:
+            data = os.pread(self.__fd, len(buffer), self.__pos)
+            size = len(data)
+            buffer[:size] = data
+        self.__pos += size
+        return size
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        if whence == 1:
+            pos += self.__pos
+        elif whence == 2:
+            pos += os.fstat(self.__fd).st_size
+        self.__pos = max(pos, 0)
+        return self.__pos
+
+    def tell(self) -> int:
+        return self.__pos
+
+    def close(self):
+        if not self.closed:
+            os.close(self.__fd)
+        super(FileView, self).close()
 
 
 def gen_increasing_slice(slice):
@@ -30,33 +98,113 @@ def gen_increasing_slice(slice):
         cur += step
 
 
-def get_or_create_descriptor(filename, open_mode='rb'):
+def get_slice_indexes(slice, get_length) -> list:
+    """Expand a slice in the list of indexes it selects.
+
+    Slices with a non negative stop (and start) keep the convention of
+    gen_increasing_slice, a start greater than the stop selects the
+    indexes in decreasing order, and do not need the number of records.
+    Open ended slices, negative bounds and negative steps follow the
+    Python semantic and are resolved with the number of records.
+
+    Args:
+        slice (slice): the slice object to expand
+        get_length (callable): returns the number of records
+
+    Returns:
+        list(int): the indexes in the requested order
+
+    """
+    if slice.stop is not None and slice.stop >= 0 and \
+            (slice.start is None or slice.start >= 0) and \
+            (slice.step is None or slice.step > 0):
+        indexes = list(gen_increasing_slice(slice))
+        if slice.start is not None and slice.start > slice.stop:
+            indexes.reverse()
+        return indexes
+    return list(range(*slice.indices(get_length())))
+
+
+def get_or_create_descriptor(filename, open_mode='rb', block_size: int = None, level: int = None, workers: int = 1):
     """Open a stream to write or read data.
 
-    Depending on the file requested it opens a different
-    file descriptor, such a gzip file or bzip file descriptor.
+    The stream is opened by the codec of the file extension (see
+    datafile.codec), for example a gzip file or a zstandard file.
 
     Args:
         filename (str): the file to open
         open_mode (str): the mode with which open the file
+        block_size (int): write gzip files as independent members
+                          of block_size decompressed bytes
+        level (int): the compression level, None for the codec default
+        workers (int): number of compression threads (block gzip only)
 
     Returns:
         file_descriptor
 
     """
-    body, ext_0 = path.splitext(filename)
-    body, ext_1 = path.splitext(body)
-    if ext_1 == '.json':
-        if ext_0 == ".gz":
-            stream = gzip.GzipFile(filename, mode=open_mode)
-        elif ext_0 == ".bz2":
-            stream = bz2.BZ2File(filename, mode=open_mode)
-        else:
-            raise Exception(
-                "Compression extension '{}' not supported...".format(ext_0))
-    elif ext_0 == '.json':
-        stream = open(filename, mode=open_mode)
-    else:
+    format_, codec = split_extension(filename)
+    if format_ != '.json':
         raise Exception(
-            "Stream format '{}' not supported...".format(ext_0))
-    return stream
+            "Stream format '{}' not supported...".format(format_ + codec.extension))
+    return codec.open(filename, open_mode, level, block_size, workers)
+
+
+def iter_prefetch(iterable, depth: int = 4, chunk_size: int = 1000):
+    """Iterate with a read-ahead on a background thread.
+
+    The background thread consumes the iterable (reading, decompressing
+    and decoding the records) and keeps up to depth chunks of
+    chunk_size items ready while the caller processes the current ones.
+    Errors of the iterable are raised in the caller.
+
+    Args:
+        iterable (iterable): the items to prefetch
+        depth (int): the maximum number of chunks ready
+        chunk_size (int): the number of items of a chunk
+
+    Returns:
+        generator: the items of the iterable
+
+    """
+    chunks = Queue(maxsize=depth)
+    stop = Event()
+
+    def put(elm) -> bool:
+        # Give up when the consumer does not iterate anymore
+        while not stop.is_set():
+            try:
+                chunks.put(elm, timeout=0.1)
+                return True
+            except Full:
+                continue
+        return False
+
+    def producer():
+        try:
+            chunk = []
+            for item in iterable:
+                chunk.append(item)
+                if len(chunk) == chunk_size:
+                    if not put((chunk, None)):
+                        return
+                    chunk = []
+            if chunk and not put((chunk, None)):
+                return
+            put((None, None))
+        except Exception as err:
+            put((None, err))
+
+    thread = Thread(target=producer, daemon=True)
+    thread.start()
+    try:
+        while True:
+            chunk, error = chunks.get()
+            if error is not None:
+                raise error
+            if chunk is None:
+                return
+            for item in chunk:
+                yield item
+    finally:
+        stop.set()
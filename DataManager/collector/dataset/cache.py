@@ -0,0 +1,321 @@
+import json
+import pickle
+import re
+from functools import partial
+from glob import glob
+from hashlib import sha256
+from os import makedirs, path, remove, replace, stat, utime
+from shutil import rmtree
+from tempfile import mkdtemp
+from types import CodeType, ModuleType
+
+from tqdm import tqdm
+
+from ..api import DataFile
+from ..datafile.bgzf import BLOCK_SIZE
+from ..datafile.json import JSONDataFileWriter
+
+__all__ = ['StageCache', 'callable_fingerprint', 'file_fingerprint']
+
+
+def file_fingerprint(filename: str) -> list:
+    """Describe a file version without reading it.
+
+    Args:
+        filename (str): the file name
+
+    Returns:
+        list: the absolute path, the size and the modification time
+    """
+    file_stat = stat(filename)
+    return [path.abspath(filename), file_stat.st_size, file_stat.st_mtime_ns]
+
+
+# The default repr of the objects, it changes in every process
+ADDRESS_REPR = re.compile(r" at 0x[0-9a-fA-F]+")
+
+
+def _code_digest(code) -> str:
+    """Hash the bytecode of a code object and of its nested functions."""
+    digest = sha256(code.co_code)
+    digest.update(repr(code.co_names).encode("utf-8"))
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            digest.update(_code_digest(const).encode("utf-8"))
+        elif isinstance(const, frozenset):
+            # The order of a set changes with the hash seed
+            digest.update(repr(sorted(const, key=repr)).encode("utf-8"))
+        else:
+            digest.update(repr(const).encode("utf-8"))
+    return digest.hexdigest()
+
+
+def _code_names(code) -> set:
+    """Get the global names used by a code object and its nested functions."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, CodeType):
+            names |= _code_names(const)
+    return names
+
+
+def _value_fingerprint(value, seen: set) -> str:
+    """Describe a value used by a function.
+
+    Objects with the default repr are described by their class and the
+    hash of their pickled state.
+
+    Returns:
+        str: the description, None if the value cannot be described
+    """
+    if isinstance(value, ModuleType):
+        return "module {}".format(value.__name__)
+    if isinstance(value, type):
+        return "class {}.{}".format(value.__module__, value.__qualname__)
+    if callable(value):
+        return _callable_fingerprint(value, seen)
+    if isinstance(value, (list, tuple)):
+        items = _values_fingerprint(value, seen)
+        return None if items is None else "{} {}".format(
+            type(value).__name__, json.dumps(items))
+    if isinstance(value, dict):
+        keys = sorted(value, key=repr)
+        items = _values_fingerprint([value[key] for key in keys], seen)
+        return None if items is None else "dict {}".format(json.dumps(
+            [[repr(key), item] for key, item in zip(keys, items)]))
+    if isinstance(value, (set, frozenset)):
+        description = repr(sorted(value, key=repr))
+    else:
+        description = repr(value)
+    if ADDRESS_REPR.search(description) is None:
+        return description
+    try:
+        state = pickle.dumps(value, protocol=4)
+    except Exception:
+        return None
+    return "{}.{} {}".format(
+        type(value).__module__, type(value).__qualname__,
+        sha256(state).hexdigest()
+    )
+
+
+def _values_fingerprint(values, seen: set) -> list:
+    """Describe a list of values, None if one cannot be described."""
+    descriptions = [_value_fingerprint(value, seen) for value in values]
+    if None in descriptions:
+        return None
+    return descriptions
+
+
+def _callable_fingerprint(function, seen: set) -> str:
+    if id(function) in seen:
+        # A recursive function, already described
+        return "recursive {}".format(
+            getattr(function, '__qualname__', type(function).__qualname__))
+    seen = seen | {id(function)}
+    if isinstance(function, partial):
+        values = _values_fingerprint(
+            [function.func, list(function.args), sorted(function.keywords.items())], seen)
+        return None if values is None else json.dumps(values)
+    if not hasattr(function, '__code__'):
+        call = getattr(type(function), '__call__', None)
+        if not hasattr(call, '__code__'):
+            # A builtin function
+            return "{}.{}".format(
+                getattr(function, '__module__', None),
+                getattr(function, '__qualname__', type(function).__qualname__)
+            )
+        # A callable object, described by its class and its attributes
+        attributes = sorted(getattr(function, '__dict__', {}).items())
+        values = _values_fingerprint(
+            [call] + [value for _, value in attributes], seen)
+        if values is None:
+            return None
+        return json.dumps([values[0], [
+            [name, value] for (name, _), value in zip(attributes, values[1:])
+        ]])
+    cells = []
+    for cell in function.__closure__ or []:
+        try:
+            cells.append(cell.cell_contents)
+        except ValueError:
+            # A variable of the enclosing function not assigned yet
+            cells.append(None)
+    global_names = sorted(
+        name for name in _code_names(function.__code__)
+        if name in function.__globals__
+    )
+    values = _values_fingerprint(
+        [function.__defaults__, function.__kwdefaults__, cells] +
+        [function.__globals__[name] for name in global_names],
+        seen
+    )
+    if values is None:
+        return None
+    return json.dumps([
+        "{}.{}".format(function.__module__, function.__qualname__),
+        _code_digest(function.__code__),
+        values[:3],
+        dict(zip(global_names, values[3:]))
+    ])
+
+
+def callable_fingerprint(function) -> str:
+    """Describe a function, None if there is no function.
+
+    The name alone does not identify lambdas, partials and closures, so
+    the description contains also the hash of the bytecode, the values
+    bound to the function and the module globals that it uses.
+
+    Args:
+        function (callable): the function, for example a record predicate
+
+    Returns:
+        str: the module, the name, the code and the values of the
+             function, None also if a value cannot be described (a
+             value without repr and not picklable), so the function
+             output cannot be cached
+    """
+    if function is None:
+        return None
+    return _callable_fingerprint(function, set())
+
+
+class StageCache(object):
+
+    """Local cache of the stage outputs.
+
+    The outputs are addressed by a fingerprint of the stage input (the
+    source description or the fingerprint of the previous stage), the
+    stage class and its configuration. When the cache is bigger than
+    max_size the least recently used outputs are removed.
+    """
+
+    def __init__(self, cache_dir: str = path.join("cache", "stages"), max_size: int = 10 * 1024 ** 3):
+        """Open a cache folder.
+
+        Args:
+            cache_dir (str): the folder of the cached outputs
+            max_size (int): max number of bytes of the cache
+
+        Returns:
+            StageCache: the instance of this object
+        """
+        self.__cache_dir = cache_dir
+        self.__max_size = max_size
+        makedirs(cache_dir, exist_ok=True)
+
+    @property
+    def cache_dir(self) -> str:
+        return self.__cache_dir
+
+    @staticmethod
+    def key(input_key: str, stage: 'Stage', batch_size: int = None) -> str:
+        """Get the fingerprint of a stage output.
+
+        Args:
+            input_key (str): the fingerprint of the stage input
+            stage (Stage): the stage
+            batch_size (int): the size of the batches of the stage input
+
+        Returns:
+            str: the hex digest that identifies the output
+        """
+        description = json.dumps([
+            input_key,
+            "{}.{}".format(type(stage).__module__, type(stage).__qualname__),
+            stage.config,
+            batch_size
+        ], sort_keys=True, default=str)
+        return sha256(description.encode("utf-8")).hexdigest()
+
+    def __filename(self, key: str) -> str:
+        return path.join(self.__cache_dir, "{}.json.gz".format(key))
+
+    def __contains__(self, key: str) -> bool:
+        return path.isfile(self.__filename(key))
+
+    def get(self, key: str) -> 'DataFile':
+        """Get a cached output.
+
+        Args:
+            key (str): the output fingerprint
+
+        Returns:
+            DataFile: the output records, None if it is not cached
+        """
+        filename = self.__filename(key)
+        if not path.isfile(filename):
+            return None
+        # The modification time is the last use of the entry
+        utime(filename)
+        return DataFile(filename)
+
+    def put(self, key: str, data) -> 'DataFile':
+        """Store a stage output.
+
+        The entry is written in a temporary folder and moved in the cache
+        with the data file as last, so that partial entries are never
+        found.
+
+        Args:
+            key (str): the output fingerprint
+            data (iterable(dict)): the output records
+
+        Returns:
+            DataFile: the cached output
+        """
+        filename = self.__filename(key)
+        tmp_dir = mkdtemp(dir=self.__cache_dir)
+        try:
+            tmp_filename = path.join(tmp_dir, path.basename(filename))
+            with JSONDataFileWriter(tmp_filename, block_size=BLOCK_SIZE) as out_file:
+                for record in tqdm(data, desc="[Cache stage output]"):
+                    out_file.append(record)
+            sidecars = sorted(glob("{}.*".format(tmp_filename)))
+            for tmp_sidecar in sidecars:
+                replace(tmp_sidecar, path.join(
+                    self.__cache_dir, path.basename(tmp_sidecar)))
+            replace(tmp_filename, filename)
+        finally:
+            rmtree(tmp_dir, ignore_errors=True)
+        self.evict(keep=key)
+        return DataFile(filename)
+
+    def __entries(self) -> list:
+        """Get the cached entries.
+
+        Returns:
+            list(tuple): (last use, size, files) of each entry
+        """
+        entries = []
+        for filename in glob(self.__filename("*")):
+            files = [filename] + glob("{}.*".format(filename))
+            entries.append((
+                stat(filename).st_mtime,
+                sum(path.getsize(cur_file) for cur_file in files),
+                files
+            ))
+        return entries
+
+    def size(self) -> int:
+        """Get the number of bytes used by the cache."""
+        return sum(size for _, size, _ in self.__entries())
+
+    def evict(self, keep: str = None):
+        """Remove the least recently used entries over the size limit.
+
+        Args:
+            keep (str): the fingerprint of an entry to never remove
+        """
+        entries = sorted(self.__entries())
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, files in entries:
+            if total_size <= self.__max_size:
+                break
+            if keep is not None and files[0] == self.__filename(keep):
+                continue
+            # The data file first, the entry is not valid anymore
+            for cur_file in files:
+                remove(cur_file)
+            total_size -= size
@@ -0,0 +1,157 @@
+import json
+from os import fsync, listdir, makedirs, path, remove, replace
+from shutil import rmtree
+
+__all__ = ['RunManifest']
+
+
+class RunManifest(object):
+
+    """Durable record of the finished batches of a Pipeline run.
+
+    For each stage the manifest keeps the shard (see write_shard) of
+    every finished batch and, when the whole stage is finished, the
+    order of the batches in the stage output. The manifest file is
+    replaced atomically after each change, so after a crash it lists
+    only batches with a complete shard.
+    """
+
+    def __init__(self, run_dir: str, resume: bool = False, source: str = None, batch_size: int = None):
+        """Open the manifest of a run.
+
+        Args:
+            run_dir (str): the folder of the manifest and of the shards
+            resume (bool): keep the finished batches of a previous run,
+                           otherwise the files of that run are removed
+            source (str): the fingerprint of the pipeline source
+            batch_size (int): the size of the batches of the stages
+
+        Returns:
+            RunManifest: the instance of this object
+        """
+        run_dir = path.abspath(run_dir)
+        self.__run_dir = run_dir
+        self.__filename = path.join(run_dir, "manifest.json")
+        self.__run = {'source': source, 'batch_size': batch_size}
+        self.__stages = {}
+        if path.isfile(self.__filename):
+            with open(self.__filename) as manifest_file:
+                manifest = json.load(manifest_file)
+            if resume:
+                if manifest['run'] != self.__run:
+                    raise Exception(
+                        "The run in '{}' has another source or batch size, it cannot be resumed...".format(run_dir))
+                self.__stages = manifest['stages']
+            else:
+                self.__clean(manifest['stages'])
+        elif path.isdir(run_dir) and listdir(run_dir):
+            raise Exception(
+                "The folder '{}' is not empty and has no run manifest...".format(run_dir))
+        makedirs(run_dir, exist_ok=True)
+
+    @property
+    def run_dir(self) -> str:
+        return self.__run_dir
+
+    def __clean(self, stages: dict):
+        """Remove the files of a previous run, and only them."""
+        for stage_name in stages:
+            rmtree(self.__shard_path(stage_name), ignore_errors=True)
+        for filename in [self.__filename, "{}.tmp".format(self.__filename)]:
+            if path.isfile(filename):
+                remove(filename)
+
+    def __shard_path(self, stage_name: str) -> str:
+        return path.join(
+            self.__run_dir, "".join(
+                char if char.isalnum() or char in "-_" else "_"
+                for char in stage_name)
+        )
+
+    def __stage(self, stage_name: str) -> dict:
+        return self.__stages.setdefault(
+            stage_name, {'batches': {}, 'order': None, 'done': False})
+
+    def save(self):
+        """Write the manifest with an atomic replace."""
+        tmp_filename = "{}.tmp".format(self.__filename)
+        with open(tmp_filename, 'w') as manifest_file:
+            json.dump({'run': self.__run, 'stages': self.__stages}, manifest_file)
+            manifest_file.flush()
+            fsync(manifest_file.fileno())
+        replace(tmp_filename, self.__filename)
+
+    def shard_dir(self, stage_name: str) -> str:
+        """Get the folder of the shards of a stage.
+
+        The stage is recorded in the manifest, so that its folder is
+        removed with the run.
+
+        Args:
+            stage_name (str): the stage name
+
+        Returns:
+            str: the folder name
+        """
+        if stage_name not in self.__stages:
+            self.__stage(stage_name)
+            self.save()
+        shard_dir = self.__shard_path(stage_name)
+        makedirs(shard_dir, exist_ok=True)
+        return shard_dir
+
+    def batches(self, stage_name: str) -> dict:
+        """Get the finished batches of a stage.
+
+        Args:
+            stage_name (str): the stage name
+
+        Returns:
+            dict: the shard manifest (shard, records, bytes) of each
+                  finished batch number
+        """
+        return {
+            int(num): tuple(manifest)
+            for num, manifest in self.__stage(stage_name)['batches'].items()
+        }
+
+    def output_order(self, stage_name: str) -> list:
+        """Get the order of the batches in the output of a finished stage.
+
+        Args:
+            stage_name (str): the stage name
+
+        Returns:
+            list(int): the batch numbers, as written in the output
+        """
+        return self.__stage(stage_name)['order']
+
+    def add_batch(self, stage_name: str, num: int, manifest: tuple):
+        """Record a finished batch.
+
+        Args:
+            stage_name (str): the stage name
+            num (int): the batch number in the stage input
+            manifest (tuple): the shard of the batch (see write_shard)
+        """
+        with open(manifest[0], 'rb') as shard_file:
+            fsync(shard_file.fileno())
+        self.__stage(stage_name)['batches'][str(num)] = list(manifest)
+        self.save()
+
+    def is_done(self, stage_name: str) -> bool:
+        """Check if all the batches of a stage are finished."""
+        return self.__stage(stage_name)['done']
+
+    def set_done(self, stage_name: str, order: list):
+        """Record that all the batches of a stage are finished.
+
+        Args:
+            stage_name (str): the stage name
+            order (list(int)): the batch numbers, as written in the
+                               output, the next stages read their
+                               batches in this order
+        """
+        self.__stage(stage_name)['order'] = list(order)
+        self.__stage(stage_name)['done'] = True
+        self.save()
@@ -10,13 +10,18 @@ from tqdm import tqdm
 from yaspin import yaspin
 
 from ...agent.api import HTTPFS
-from ..api import DataFile
+from ..api import DataFile, PartitionedDataFile
 from ..datafeatures.extractor import (CMSDataPopularity, CMSDataPopularityRaw,
                                       CMSSimpleRecord)
+from ..datafile.avro import AvroDataFileWriter
+from ..datafile.bgzf import BLOCK_SIZE
 from ..datafile.json import JSONDataFileWriter
-from .stage import Stage
+from ..datafile.utils import iter_prefetch
+from .checkpoint import RunManifest
+from .resource import Resource
+from .stage import Stage, fuse_stages
 from .utils import (ReadableDictAsAttribute, SupportTable, flush_queue,
-                    gen_window_dates)
+                    gen_window_dates, metadata_path)
 
 
 class Pipeline(object):
@@ -27,7 +32,10 @@ class Pipeline(object):
         stages: list = [],
         source: 'Resource' = None,
         spark_conf: dict = {},
-        batch_size: int = 42000
+        batch_size: int = 42000,
+        prefetch: int = 0,
+        cache: 'StageCache' = None,
+        checkpoint_dir: str = None
     ):
         assert all(isinstance(stage, Stage)
                    for stage in stages), "You can pass only a list of Stages..."
@@ -36,6 +44,13 @@ class Pipeline(object):
         self._source = source
         self._result = None
         self._batch_size = batch_size
+        # Number of batches read ahead between the stages, 0 disables it
+        self._prefetch = prefetch
+        # Outputs of previous runs, the stages with a cached output are skipped
+        self._cache = cache
+        # Folder of the run manifest and of the stage shards, None
+        # disables the checkpoints
+        self._checkpoint_dir = checkpoint_dir
         self.__stats = {
             'time': {
                 'stages': {},
@@ -57,14 +72,28 @@ class Pipeline(object):
     def stats(self):
         return self.__stats
 
-    def save(self, out_dir: str = 'PipelineResults'):
-        out_name = "{}.json.gz".format(self._dataset_name)
+    def save(self, out_dir: str = 'PipelineResults', codec: str = '.gz', compression_level: int = None, workers: int = 1, output_format: str = 'json'):
         makedirs(out_dir, exist_ok=True)
-        out_file_path = path.join(out_dir, out_name)
         # Write output
         start_time = time()
         print("[Pipeline][{}][Write output]".format(self._dataset_name))
-        with JSONDataFileWriter(out_file_path) as out_file:
+        if output_format == 'json':
+            out_file = JSONDataFileWriter(
+                path.join(out_dir, "{}.json{}".format(
+                    self._dataset_name, codec)),
+                block_size=BLOCK_SIZE,
+                compression_level=compression_level,
+                workers=workers
+            )
+        elif output_format == 'avro':
+            out_file = AvroDataFileWriter(
+                path.join(out_dir, "{}.avro".format(self._dataset_name)),
+                compression_level=compression_level
+            )
+        else:
+            raise Exception(
+                "Output format '{}' not supported...".format(output_format))
+        with out_file:
             for record in tqdm(self.result, desc="[Save dataset]"):
                 out_file.append(record)
         self.__stats['time']['out_file'] = time() - start_time
@@ -77,6 +106,8 @@ class Pipeline(object):
         return self
 
     def gen_batches(self, data, stage_name):
+        if self._prefetch > 0:
+            data = iter_prefetch(data, self._prefetch, self._batch_size)
         batch = []
         for record in data:
             batch.append(record)
@@ -93,21 +124,60 @@ class Pipeline(object):
                 ))
                 yield batch
 
-    def run(self, save_stage: bool = False, use_spark: bool = False):
+    def run(self, save_stage: bool = False, use_spark: bool = False, fuse: bool = False, resume: bool = False):
         output = None
+        stages = self._stages
+        checkpoint = None
+        if self._checkpoint_dir is not None:
+            # With resume the finished batches of the last run are skipped
+            checkpoint = RunManifest(
+                self._checkpoint_dir,
+                resume=resume,
+                source=self._source.fingerprint(),
+                batch_size=self._batch_size
+            )
+        else:
+            assert not resume, "You need a checkpoint_dir to resume a run..."
+        if fuse:
+            # Consecutive stages run in the same worker for each batch,
+            # only the fused stage output is materialized
+            stages = fuse_stages(self._stages)
+
+        # Fingerprint of the current stage input, None disables the cache
+        input_key = None
+        if self._cache is not None:
+            input_key = self._source.fingerprint()
 
         print("[Pipeline][{}][START]".format(self._dataset_name))
-        for stage in self._stages:
+        for stage in stages:
             start_time = time()
 
-            if output is None:
+            stage_key = None
+            cached_output = None
+            if input_key is not None:
+                stage_key = self._cache.key(
+                    input_key, stage, self._batch_size)
+                cached_output = self._cache.get(stage_key)
+
+            if cached_output is not None:
+                print("[Pipeline][{}][{}][CACHED]".format(
+                    self._dataset_name, stage.name)
+                )
+                output = cached_output
+            elif checkpoint is not None and checkpoint.is_done(stage.name):
+                print("[Pipeline][{}][{}][RESTORED]".format(
+                    self._dataset_name, stage.name)
+                )
+                output = stage.restore(checkpoint)
+            elif output is None:
                 output = self._source.get()
                 print("[Pipeline][{}][{}][RUN]".format(
                     self._dataset_name, stage.name)
                 )
                 output = stage.run(
                     output,
-                    use_spark=use_spark
+                    use_spark=use_spark,
+                    checkpoint=checkpoint
                 )
             else:
                 print("[Pipeline][{}][{}][RUN]".format(
@@ -115,12 +185,17 @@ class Pipeline(object):
                 )
                 output = stage.run(
                     self.gen_batches(output, stage.name),
-                    use_spark=use_spark
+                    use_spark=use_spark,
+                    checkpoint=checkpoint
                 )
 
+            if stage_key is not None and cached_output is None:
+                output = self._cache.put(stage_key, output)
+            input_key = stage_key
+
             if save_stage:
                 self._source.set(
-                    stage.output,
+                    output,
                     stage_name=stage.name
                 )
 
@@ -143,6 +218,10 @@ class CMSDataset(object):
     def __init__(self, spark_conf: dict = {}, source: dict = {}, dest: dict = {}):
         self._source = Resource()
         self._dest = Resource()
+        for resource in [self._source, self._dest]:
+            resource.httpfs = None
+            resource.hdfs_base_path = ""
+            resource.local_folder = ""
         self._spark_context = None
 
         # Spark defaults
@@ -224,14 +303,15 @@ class CMSDataset(object):
             ).collect()
             collector = DataFile(binary_file[0])
         elif self._source.local_folder:
-            cur_file_path = path.join(
+            day_data = PartitionedDataFile(
                 path.abspath(self._source.local_folder),
-                "year={}".format(year),
-                "month={}".format(month),
-                "day={}".format(day),
-                "part-m-00000.avro"
+                [(year, month, day)],
+                pattern="part-*.avro"
             )
-            collector = DataFile(cur_file_path)
+            if not day_data.partitions:
+                raise FileNotFoundError(
+                    "No data for {}-{}-{}".format(year, month, day))
+            collector = day_data.partition(0)
         else:
             raise Exception("No methods to retrieve data...")
         return collector
@@ -240,7 +320,7 @@ class CMSDataset(object):
     def task_raw_extraction(elm):
         return CMSDataPopularityRaw(elm)
 
-    def gen_raw(self, start_date: str, window_size: int, use_spark: bool = False):
+    def gen_raw(self, start_date: str, window_size: int, use_spark: bool = False, num_readers: int = 1):
         result = []
         start_year, start_month, start_day = [
             int(elm) for elm in start_date.split()
@@ -271,8 +351,13 @@ class CMSDataset(object):
                 start_year, start_month, start_day, window_size
             ):
                 collector = self.get_data_collector(year, month, day)
+                if num_readers > 1:
+                    # The day file is decoded by num_readers processes
+                    collector = collector.get_data_parallel(num_readers)
                 for elm in tqdm(pool.imap(
-                    self.task_raw_extraction, collector
+                    self.task_raw_extraction,
+                    collector,
+                    chunksize=1000
                 ), desc="Extract {}-{}-{}".format(year, month, day)):
                     if elm:
                         result.append(elm)
@@ -765,7 +850,9 @@ class CMSDatasetV0(CMSDataset):
     def save(self, from_: str, window_size: int, outfile_name: str = '',
              use_spark: bool = False, extract_support_tables: bool = True,
              multiprocess: bool = False, num_processes: int = 2,
-             checkpoint_step: int = 10000
+             checkpoint_step: int = 10000, codec: str = '.gz',
+             compression_level: int = None,
+             compression_workers: int = 1
              ):
         """Extract and save a dataset.
 
@@ -781,6 +868,11 @@ class CMSDatasetV0(CMSDataset):
             multiprocess (bool): use Python multiprocessing
             num_processes (int=2): number of process for Python multiprocessing
             checkpoint_step (int=10000): stride for checkpoint extraction
+            codec (str='.gz'): compression extension of the output
+                               (see datafile.codec), for example '.zst'
+            compression_level (int=None): compression level of the output,
+                                          None for the codec default
+            compression_workers (int=1): number of compression threads
 
         Returns:
             This object instance (for chaining operations)
@@ -806,8 +898,8 @@ class CMSDatasetV0(CMSDataset):
         print("Data extracted in {}s".format(extraction_time))
 
         if not outfile_name:
-            outfile_name = "CMSDatasetV0_{}_{}.json.gz".format(
-                "-".join(from_.split()), window_size)
+            outfile_name = "CMSDatasetV0_{}_{}.json{}".format(
+                "-".join(from_.split()), window_size, codec)
 
         metadata = {
             'type': "metadata",
@@ -823,7 +915,13 @@ class CMSDatasetV0(CMSDataset):
             'checkpoints': {}
         }
 
-        with JSONDataFileWriter(outfile_name) as out_file:
+        with JSONDataFileWriter(
+            outfile_name,
+            index=True,
+            block_size=BLOCK_SIZE,
+            compression_level=compression_level,
+            workers=compression_workers
+        ) as out_file:
 
             for record in tqdm(data.values(), desc="Write data"):
                 cur_record = record
@@ -841,14 +939,18 @@ class CMSDatasetV0(CMSDataset):
                     'features',
                     record.feature_dict
                 ))
-                position = out_file.append(record.to_dict())
+                position = out_file.position
+                out_file.append(record.to_dict())
                 if idx in [0, raw_info['len_raw_window']] or idx % checkpoint_step == 0:
                     metadata['checkpoints'][metadata['len'] + idx] = position
 
             with yaspin(text="Write metadata...") as spinner:
                 spinner.text = "Write metadata..."
                 start_time = time()
+                # Last record for readers without the sidecar
                 out_file.append(metadata)
+                with open(metadata_path(outfile_name), 'w') as meta_file:
+                    json.dump(metadata, meta_file)
                 spinner.write("Metadata written in {}s".format(
                     time() - start_time)
                 )
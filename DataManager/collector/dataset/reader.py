@@ -1,4 +1,6 @@
 import json
+from itertools import islice
+from os import path
 
 import matplotlib.pyplot as plt
 import numpy as np
@@ -6,14 +8,16 @@ from tqdm import tqdm
 
 from ..datafeatures.extractor import CMSRecordTest0
 from ..datafile.json import JSONDataFileReader
-from .utils import ReadableDictAsAttribute, SupportTable
+from ..datafile.utils import iter_prefetch
+from .utils import ReadableDictAsAttribute, SupportTable, metadata_path
 
 
 class CMSDatasetTest0Reader(object):
 
-    def __init__(self, filename):
+    def __init__(self, filename, num_readers: int = 1):
         print("[Open dataset: {}]".format(filename))
         self._collector = JSONDataFileReader(filename)
+        self._num_readers = num_readers
         self._score_avg = 0.0
         self._support_table = SupportTable()
         print("[Dataset loaded...]")
@@ -21,10 +25,15 @@ class CMSDatasetTest0Reader(object):
     def __len__(self):
         return len(self._collector)
 
+    def _iter_records(self, ordered: bool = True):
+        if self._num_readers > 1:
+            return self._collector.iter_parallel(self._num_readers, ordered=ordered)
+        return iter(self._collector)
+
     def gen_support_table(self, reduce_categories_to_lvl: int = 0):
         categories = set()
         # Insert data
-        for record in tqdm(self._collector, desc="[Gen Support Table]"):
+        for record in tqdm(self._iter_records(ordered=False), desc="[Gen Support Table]"):
             for key, value in record['features'].items():
                 if key not in categories:
                     categories |= set((key, ))
@@ -47,7 +56,7 @@ class CMSDatasetTest0Reader(object):
 
     @property
     def scores(self):
-        return (CMSRecordTest0().load(elm).score for elm in self._collector)
+        return (CMSRecordTest0().load(elm).score for elm in self._iter_records())
 
     @property
     def score_avg(self):
@@ -70,7 +79,11 @@ class CMSDatasetV0Reader(object):
     def __init__(self, filename):
         print("[Open dataset: {}]".format(filename))
         self._collector = JSONDataFileReader(filename)
-        self._meta = ReadableDictAsAttribute(self._collector[-1])
+        if path.isfile(metadata_path(filename)):
+            with open(metadata_path(filename)) as meta_file:
+                self._meta = ReadableDictAsAttribute(json.load(meta_file))
+        else:
+            self._meta = ReadableDictAsAttribute(self._collector[-1])
         if 'checkpoints' in self._meta:
             print("[Load checkpoints]")
             for index, pos in self._meta.checkpoints.items():
@@ -80,18 +93,24 @@ class CMSDatasetV0Reader(object):
         self.__sorted_keys = None
         print("[Dataset loaded...]")
 
-    def get_raw_window(self):
-        for record in self._collector.start_from(
+    def get_raw_window(self, prefetch: int = 0):
+        records = self._collector.start_from(
             self._meta.raw_window_start,
             self._meta.raw_window_start + self._meta.len_raw_window
-        ):
+        )
+        if prefetch > 0:
+            records = iter_prefetch(records, prefetch)
+        for record in records:
             yield record
 
-    def get_raw_next_window(self):
-        for record in self._collector.start_from(
+    def get_raw_next_window(self, prefetch: int = 0):
+        records = self._collector.start_from(
             self._meta.raw_next_window_start,
             self._meta.raw_next_window_start + self._meta.len_raw_next_window
-        ):
+        )
+        if prefetch > 0:
+            records = iter_prefetch(records, prefetch)
+        for record in records:
             yield record
 
     def get_raw(self, index, next_window: bool = False, as_tensor: bool = False):
@@ -167,7 +186,7 @@ class CMSDatasetV0Reader(object):
 
     @property
     def records(self):
-        for record in self._collector[:self._meta.len]:
+        for record in islice(iter(self._collector), self._meta.len):
             yield record
 
     @property
@@ -1,14 +1,17 @@
+import json
 import os
 from io import BytesIO
 from os import makedirs, path
+from shutil import copyfileobj
 from tempfile import NamedTemporaryFile
 
 from tqdm import tqdm
 from yaspin import yaspin
 
 from ...agent.api import HTTPFS
-from ..api import DataFile
+from ..api import DataFile, PartitionedDataFile
 from ..datafile.json import JSONDataFileReader, JSONDataFileWriter
+from .cache import callable_fingerprint, file_fingerprint
 from .utils import BaseSpark, gen_window_dates
 
 
@@ -23,13 +26,22 @@ class Resource(BaseSpark):
     def set(self):
         raise NotImplementedError
 
+    def fingerprint(self) -> str:
+        """Describe the source data for the stage cache.
+
+        Returns:
+            str: the source description, None if it cannot be cached
+        """
+        return None
+
 
 class CMSDatasetResourceManager(BaseSpark):
 
-    def __init__(self, dataset_local_path: str, spark_conf: dict = {}, batch_size: int=100000):
+    def __init__(self, dataset_local_path: str, spark_conf: dict = {}, batch_size: int=100000, num_readers: int = 1):
         super(CMSDatasetResourceManager, self).__init__(spark_conf=spark_conf)
         self.__dataset_path = dataset_local_path
         self.__batch_size = batch_size
+        self.__num_readers = num_readers
     
     def gen_batches(self, data):
         batch = []
@@ -48,8 +60,22 @@ class CMSDatasetResourceManager(BaseSpark):
                 ))
                 yield batch
 
+    def fingerprint(self) -> str:
+        """Describe the source data for the stage cache.
+
+        Returns:
+            str: the dataset file version and the batch size
+        """
+        return json.dumps({
+            'dataset': file_fingerprint(self.__dataset_path),
+            'batch_size': self.__batch_size
+        })
+
     def get(self):
-        return self.gen_batches(DataFile(self.__dataset_path))
+        data = DataFile(self.__dataset_path)
+        if self.__num_readers > 1:
+            return self.gen_batches(data.get_data_parallel(self.__num_readers))
+        return self.gen_batches(data)
 
     def set(self, data: 'DataFile', out_name: str, out_dir: str = 'cache'):
         with NamedTemporaryFile() as tmp_file:
@@ -60,8 +86,8 @@ class CMSDatasetResourceManager(BaseSpark):
                 with yaspin(text="[Save Dataset]") as spinner:
                     cur_base_path = out_dir
                     makedirs(cur_base_path, exist_ok=True)
-                    with open(path.join(cur_base_path, out_name), 'w') as out_data:
-                        out_data.write(tmp_data.raw_data)
+                    with open(path.join(cur_base_path, out_name), 'wb') as out_data:
+                        copyfileobj(tmp_data.view(), out_data)
 
                     spinner.write("[Dataset saved]")
 
@@ -73,9 +99,28 @@ class CMSResourceManager(Resource):
         start_date: str,
         window_size: int,
         spark_conf: dict = {},
-        resource: dict = {}
+        resource: dict = {},
+        fields: list = None,
+        predicate=None
     ):
+        """Manage the CMS popularity day files of a time window.
+
+        Args:
+            start_date (str): the first day, in the format "YYYY MM DD"
+            window_size (int): the number of days
+            spark_conf (dict): the Spark configuration
+            resource (dict): where to find the data ('httpfs', 'hdfs'
+                             or 'local')
+            fields (list(str)): decode only these fields of the records
+            predicate (callable): a picklable function that selects the
+                                  records to read
+
+        Returns:
+            CMSResourceManager: the instance of this object
+        """
         super(CMSResourceManager, self).__init__(spark_conf=spark_conf)
+        self._fields = fields
+        self._predicate = predicate
 
         self._year, self._month, self._day = [
             int(elm) for elm in start_date.split()
@@ -116,7 +161,58 @@ class CMSResourceManager(Resource):
         else:
             raise Exception("Cannot determine type...")
 
+    def fingerprint(self) -> str:
+        """Describe the data of the window for the stage cache.
+
+        Local files are identified by their size and modification time,
+        remote ones by their location.
+
+        Returns:
+            str: the source description, None if the predicate cannot
+                 be described
+        """
+        if self._predicate is not None and callable_fingerprint(self._predicate) is None:
+            return None
+        description = {
+            'type': self.type,
+            'start_date': [self._year, self._month, self._day],
+            'window_size': self._window_size,
+            'fields': self._fields,
+            'predicate': callable_fingerprint(self._predicate)
+        }
+        if self._local_folder:
+            dataset = PartitionedDataFile(
+                path.abspath(self._local_folder),
+                gen_window_dates(
+                    self._year, self._month, self._day, self._window_size),
+                pattern="part-*.avro"
+            )
+            description['files'] = [
+                file_fingerprint(filename) for filename in dataset.partitions
+            ]
+        elif self._httpfs is not None:
+            description['base_path'] = self._httpfs_base_path
+        else:
+            description['base_path'] = self._hdfs_base_path
+        return json.dumps(description, sort_keys=True)
+
     def get(self) -> 'DataFile':
+        if self._local_folder:
+            dataset = PartitionedDataFile(
+                path.abspath(self._local_folder),
+                gen_window_dates(
+                    self._year, self._month, self._day, self._window_size),
+                pattern="part-*.avro",
+                fields=self._fields,
+                predicate=self._predicate
+            )
+            # A missing day would silently shrink the window
+            if dataset.missing_dates:
+                raise FileNotFoundError("No data for {}-{}-{}".format(
+                    *dataset.missing_dates[0]))
+            for collector in dataset.iter_partitions():
+                yield collector
+            return
         for year, month, day in gen_window_dates(
                 self._year, self._month, self._day, self._window_size):
             if self._httpfs is not None:
@@ -126,22 +222,15 @@ class CMSResourceManager(Resource):
                         )
                 ):
                     cur_file = self._httpfs.open(full_path)
-                    collector = DataFile(cur_file)
+                    collector = DataFile(
+                        cur_file, self._fields, self._predicate)
             elif self._hdfs_base_path:
                 sc = self.spark_context
                 binary_file = sc.binaryFiles("{}/year={:4d}/month={:d}/day={:d}/part-m-00000.avro".format(
                     self._hdfs_base_path, year, month, day)
                 ).collect()
-                collector = DataFile(binary_file[0])
-            elif self._local_folder:
-                cur_file_path = path.join(
-                    path.abspath(self._local_folder),
-                    "year={}".format(year),
-                    "month={}".format(month),
-                    "day={}".format(day),
-                    "part-m-00000.avro"
-                )
-                collector = DataFile(cur_file_path)
+                collector = DataFile(
+                    binary_file[0], self._fields, self._predicate)
             else:
                 raise Exception("No methods to retrieve data...")
             yield collector
@@ -167,8 +256,8 @@ class CMSResourceManager(Resource):
                             out_dir
                         )
                         makedirs(cur_base_path, exist_ok=True)
-                        with open(path.join(cur_base_path, out_name), 'w') as out_data:
-                            out_data.write(tmp_data.raw_data)
+                        with open(path.join(cur_base_path, out_name), 'wb') as out_data:
+                            copyfileobj(tmp_data.view(), out_data)
 
                     elif self.type == 'httpfs':
                         self._httpfs.create(
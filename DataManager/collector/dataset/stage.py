@@ -1,5 +1,13 @@
-from multiprocessing import Pool, Process, Queue, cpu_count
-from tempfile import TemporaryFile
+from collections import deque
+from concurrent.futures import (FIRST_COMPLETED, Future, ProcessPoolExecutor,
+                                wait)
+from functools import partial
+from json import dumps
+from multiprocessing import cpu_count
+from os import path
+from os import remove as os_remove
+from shutil import rmtree
+from tempfile import TemporaryFile, mkdtemp
 
 from tqdm import tqdm
 from yaspin import yaspin
@@ -7,21 +15,81 @@ from yaspin import yaspin
 from ..api import DataFile
 from ..datafeatures.extractor import (CMSDataPopularity, CMSDataPopularityRaw,
                                       CMSRecordTest0)
+from ..datafile.avro import AvroDataFileWriter
 from ..datafile.json import JSONDataFileReader, JSONDataFileWriter
-from .utils import BaseSpark, flush_queue
+from .utils import BaseSpark, write_shard
+
+
+def run_transforms(transforms: list, records, shard: str = None):
+    """Apply the stage transformations to a batch and serialize the result.
+
+    Args:
+        transforms (list): the transform functions of the stages, in order
+        records (list): the input batch
+        shard (str): the shard file where to write the result
+
+    Returns:
+        list or tuple: the JSON strings or the shard manifest if a shard
+                       is given (see write_shard)
+    """
+    for transform in transforms:
+        records = transform(records)
+    records = [dumps(record) for record in records]
+    if shard:
+        return write_shard(shard, records)
+    return records
+
+
+def classify_records(records) -> list:
+    """Mark the records with a score over the average as good.
+
+    Args:
+        records (iterable(CMSRecordTest0)): the aggregated records
+
+    Returns:
+        list(dict): the records with their class, 'good' or 'bad'
+    """
+    records = list(records)
+    avg_score = sum(elm.score for elm in records) / len(records)
+
+    for record in records:
+        if record.score >= avg_score:
+            record.set_class('good')
+        else:
+            record.set_class('bad')
+
+    return [elm.to_dict() for elm in records]
 
 
 class Stage(BaseSpark):
 
+    # The stage needs the whole output of the previous stage and
+    # it is never fused with the other stages
+    barrier = False
+
     def __init__(
         self,
         name: str,
         source: 'Resource' = None,
-        spark_conf: dict = {}
+        spark_conf: dict = {},
+        output_format: str = 'json',
+        in_flight: int = None,
+        ordered: bool = False
     ):
         super(Stage, self).__init__(spark_conf=spark_conf)
         self._name = name
-        self._output = JSONDataFileWriter(descriptor=TemporaryFile())
+        # Max number of batches submitted to the workers, None is twice
+        # the number of processes
+        self._in_flight = in_flight
+        # Keep the output in the same order of the input batches
+        self._ordered = ordered
+        if output_format == 'json':
+            self._output = JSONDataFileWriter(descriptor=TemporaryFile())
+        elif output_format == 'avro':
+            self._output = AvroDataFileWriter(descriptor=TemporaryFile())
+        else:
+            raise Exception(
+                "Output format '{}' not supported...".format(output_format))
 
     @property
     def name(self):
@@ -31,14 +99,17 @@ class Stage(BaseSpark):
     def output(self):
         return self._output
 
+    @property
+    def config(self) -> dict:
+        """The settings that change the stage output (see StageCache)."""
+        return {'name': self._name}
+
     @staticmethod
-    def __update_tasks(task_list):
-        return [
-            task for task in task_list if task.is_alive()
-        ]
+    def transform(records) -> list:
+        raise NotImplementedError
 
     @staticmethod
-    def process(records, queue: 'Queue' = None):
+    def process(records, shard: str = None):
         raise NotImplementedError
 
     def pre_input(self, input_):
@@ -47,7 +118,40 @@ class Stage(BaseSpark):
     def pre_output(self, input_):
         return input_
 
-    def task(self, input_, num_process: int = cpu_count(), use_spark: bool = False):
+    def __collect(self, pending: 'deque', order: list, checkpoint: 'RunManifest' = None):
+        """Write in the output the shards of completed tasks.
+
+        Args:
+            pending (deque): the (batch number, future, restored) of the
+                             submitted tasks, the completed ones are
+                             removed
+            order (list): the batch numbers written in the output, the
+                          new ones are appended
+            checkpoint (RunManifest): where to record the finished
+                                      batches, their shards are kept
+
+        """
+        if self._ordered:
+            done = [pending.popleft()]
+        else:
+            futures, _ = wait(
+                [future for _, future, _ in pending],
+                return_when=FIRST_COMPLETED
+            )
+            done = [elm for elm in pending if elm[1] in futures]
+        for num, future, restored in done:
+            if not self._ordered:
+                pending.remove((num, future, restored))
+            shard, records, size = future.result()
+            if checkpoint is not None and not restored:
+                checkpoint.add_batch(self.name, num, (shard, records, size))
+            if records > 0:
+                self._output.append_file(shard, records)
+            order.append(num)
+            if checkpoint is None:
+                os_remove(shard)
+
+    def task(self, input_, num_process: int = cpu_count(), use_spark: bool = False, checkpoint: 'RunManifest' = None):
         if use_spark:
             sc = self.spark_context
             print("[STAGE][{}][SPARK]".format(self.name))
@@ -64,7 +168,7 @@ class Stage(BaseSpark):
                 ).collect()
 
                 for cur_res in tmp_res:
-                    self._output.append(cur_res)
+                    self._output.extend(cur_res, validate=False)
 
                 tasks = [cur_input]
             else:
@@ -77,72 +181,108 @@ class Stage(BaseSpark):
                     ).collect()
 
                     for cur_res in tmp_res:
-                        self._output.append(cur_res)
+                        self._output.extend(cur_res, validate=False)
         else:
-            tasks = []
-            output_queue = Queue()
-            with yaspin(text="[STAGE][{}]".format(self.name)) as spinner:
-                for cur_input in input_:
-                    if len(tasks) < num_process:
-                        new_process = Process(
-                            target=self.process,
-                            args=(cur_input, output_queue)
-                        )
-                        tasks.append(new_process)
-                        new_process.start()
-                        spinner.write(
-                            "[STAGE][{}][TASK ADDED]".format(self.name))
-                        continue
-
-                    while len(tasks) == num_process:
-                        for task in tasks:
-                            task.join(5)
+            in_flight = self._in_flight or 2 * num_process
+            pending = deque()
+            order = []
+            # Each batch is written by its worker in a shard file, kept
+            # in the run folder when there is a checkpoint
+            finished = {}
+            if checkpoint is not None:
+                shard_dir = checkpoint.shard_dir(self.name)
+                finished = checkpoint.batches(self.name)
+            else:
+                shard_dir = mkdtemp(prefix="stage-")
+            try:
+                with ProcessPoolExecutor(num_process) as executor, \
+                        yaspin(text="[STAGE][{}]".format(self.name)) as spinner:
+                    for num, cur_input in enumerate(input_):
+                        if num in finished:
+                            # Batch of a previous run, reuse its shard
+                            future = Future()
+                            future.set_result(finished[num])
+                            pending.append((num, future, True))
                         else:
-                            tasks = self.__update_tasks(tasks)
-                            self._output.append(flush_queue(output_queue))
-                    spinner.text = "[STAGE][{}][{} task{} running]".format(
-                        self.name,
-                        len(tasks),
-                        's' if len(tasks) > 1 else ''
-                    )
-                else:
-                    while len(tasks) > 0:
+                            shard = path.join(
+                                shard_dir, "shard-{:06d}.json".format(num))
+                            pending.append((num, executor.submit(
+                                self.process, cur_input, shard), False))
+                            spinner.write(
+                                "[STAGE][{}][TASK ADDED]".format(self.name))
+                        while len(pending) >= in_flight:
+                            self.__collect(pending, order, checkpoint)
                         spinner.text = "[STAGE][{}][{} task{} running]".format(
                             self.name,
-                            len(tasks),
-                            's' if len(tasks) > 1 else ''
+                            len(pending),
+                            's' if len(pending) > 1 else ''
                         )
-                        for task in tasks:
-                            task.join(5)
-                        else:
-                            tasks = self.__update_tasks(tasks)
-                            self._output.append(flush_queue(output_queue))
+                    while len(pending) > 0:
+                        self.__collect(pending, order, checkpoint)
+                        spinner.text = "[STAGE][{}][{} task{} running]".format(
+                            self.name,
+                            len(pending),
+                            's' if len(pending) > 1 else ''
+                        )
+            finally:
+                if checkpoint is None:
+                    rmtree(shard_dir, ignore_errors=True)
+            if checkpoint is not None:
+                checkpoint.set_done(self.name, order)
 
         return self._output
 
-    def run(self, input_, use_spark: bool = False):
+    def run(self, input_, use_spark: bool = False, checkpoint: 'RunManifest' = None):
         task_input = self.pre_input(input_)
-        task_output = self.task(task_input, use_spark=use_spark)
+        task_output = self.task(
+            task_input, use_spark=use_spark, checkpoint=checkpoint)
         self._output = self.pre_output(DataFile(task_output))
         return self._output
 
+    def restore(self, checkpoint: 'RunManifest'):
+        """Build the output of a finished stage from its checkpoint shards.
+
+        Args:
+            checkpoint (RunManifest): the manifest of the run
+
+        Returns:
+            DataFile: the stage output, as returned by run
+        """
+        batches = checkpoint.batches(self.name)
+        # The same order of the finished run, the next stages made
+        # their batches from it
+        for num in checkpoint.output_order(self.name):
+            shard, records, _ = batches[num]
+            if records > 0:
+                self._output.append_file(shard, records)
+        self._output = self.pre_output(DataFile(self._output))
+        return self._output
+
 
 class CMSRecordTest0Stage(Stage):
 
+    barrier = True
+
     def __init__(
         self,
         name: str = "CMS-Record-Test0",
         source: 'Resource' = None,
-        spark_conf: dict = {}
+        spark_conf: dict = {},
+        output_format: str = 'json',
+        in_flight: int = None,
+        ordered: bool = False
     ):
         super(CMSRecordTest0Stage, self).__init__(
             name,
             source=source,
-            spark_conf=spark_conf
+            spark_conf=spark_conf,
+            output_format=output_format,
+            in_flight=in_flight,
+            ordered=ordered
         )
 
     @staticmethod
-    def process(records, queue: 'Queue' = None):
+    def transform(records) -> list:
         tmp = {}
 
         for record in records:
@@ -156,11 +296,11 @@ class CMSRecordTest0Stage(Stage):
             if len(tmp) >= 100:
                 break
 
-        if queue:
-            for record in tmp.values():
-                queue.put(record.dumps())
-        else:
-            return [elm.dumps() for elm in tmp.values()]
+        return [elm.to_dict() for elm in tmp.values()]
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([CMSRecordTest0Stage.transform], records, shard)
 
     def pre_output(self, output):
         tmp = {}
@@ -171,16 +311,8 @@ class CMSRecordTest0Stage(Stage):
                 tmp[cur_record.record_id] = cur_record
             else:
                 tmp[cur_record.record_id] += cur_record
-        
-        avg_score = sum(elm.score for elm in tmp.values()) / len(tmp)
-
-        for record in tmp.values():
-            if record.score >= avg_score:
-                record.set_class('good')
-            else:
-                record.set_class('bad')
 
-        return [elm.to_dict() for elm in tmp.values()]
+        return classify_records(tmp.values())
 
 
 class CMSFeaturedStage(Stage):
@@ -189,32 +321,38 @@ class CMSFeaturedStage(Stage):
         self,
         name: str = "CMS-Featured",
         source: 'Resource' = None,
-        spark_conf: dict = {}
+        spark_conf: dict = {},
+        output_format: str = 'json',
+        in_flight: int = None,
+        ordered: bool = False
     ):
         super(CMSFeaturedStage, self).__init__(
             name,
             source=source,
-            spark_conf=spark_conf
+            spark_conf=spark_conf,
+            output_format=output_format,
+            in_flight=in_flight,
+            ordered=ordered
         )
 
     @staticmethod
-    def process(records, queue: 'Queue' = None):
+    def transform(records) -> list:
         tmp = []
 
         for record in records:
             new_record = CMSDataPopularity(record['features'])
             if new_record:
-                tmp.append(new_record.dumps())
+                tmp.append(new_record.to_dict())
 
             # Limit processing for test
             # if len(tmp) >= 1000:
             #     break
 
-        if queue:
-            for record in tmp:
-                queue.put(record)
-        else:
-            return tmp
+        return tmp
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([CMSFeaturedStage.transform], records, shard)
 
 
 class CMSRawStage(Stage):
@@ -224,18 +362,34 @@ class CMSRawStage(Stage):
         name: str = "CMS-raw",
         source: 'Resource' = None,
         spark_conf: dict = {},
-        batch_size: int = 42000
+        batch_size: int = 42000,
+        output_format: str = 'json',
+        num_readers: int = 1,
+        prefetch: int = 0,
+        in_flight: int = None,
+        ordered: bool = False
     ):
         super(CMSRawStage, self).__init__(
             name,
             source=source,
-            spark_conf=spark_conf
+            spark_conf=spark_conf,
+            output_format=output_format,
+            in_flight=in_flight,
+            ordered=ordered
         )
         self.__batch_size = batch_size
+        self.__num_readers = num_readers
+        self.__prefetch = prefetch
 
     def pre_input(self, input_):
         tmp_data = []
         for cur_input in input_:
+            if self.__num_readers > 1:
+                # Decode the blocks of the day file in parallel
+                cur_input = cur_input.get_data_parallel(self.__num_readers)
+            elif self.__prefetch > 0:
+                # Decode the next chunks while the batch is filled
+                cur_input = cur_input.get_data_prefetch(self.__prefetch)
             for record in cur_input:
                 tmp_data.append(record)
                 if len(tmp_data) == self.__batch_size:
@@ -252,19 +406,101 @@ class CMSRawStage(Stage):
                 yield tmp_data
 
     @staticmethod
-    def process(records, queue: 'Queue' = None):
+    def transform(records) -> list:
         tmp = []
         for record in records:
             new_record = CMSDataPopularityRaw(record)
             if new_record:
-                tmp.append(new_record.dumps())
+                tmp.append(new_record.to_dict())
 
             # Limit processing for test
             # if len(tmp) >= 1000:
             #     break
 
-        if queue:
-            for record in tmp:
-                queue.put(record)
+        return tmp
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([CMSRawStage.transform], records, shard)
+
+
+class FusedStage(Stage):
+
+    """Run consecutive stages as a single per-batch function.
+
+    The batches flow through the transformations of all the stages in
+    the same worker: only the records of the last stage are serialized
+    and written in the output.
+    """
+
+    def __init__(self, stages: list):
+        first = stages[0]
+        super(FusedStage, self).__init__(
+            "+".join(stage.name for stage in stages),
+            spark_conf={
+                'master': first._spark_master,
+                'app_name': first._spark_app_name,
+                'config': first._spark_conf
+            },
+            in_flight=first._in_flight,
+            ordered=first._ordered
+        )
+        self._stages = stages
+        self._output = stages[-1].output
+        # A partial of a module function is picklable for the workers
+        self.process = partial(
+            run_transforms, [stage.transform for stage in stages])
+
+    @property
+    def stages(self):
+        return self._stages
+
+    @property
+    def config(self) -> dict:
+        return {
+            'stages': [
+                ["{}.{}".format(type(stage).__module__, type(stage).__qualname__),
+                 stage.config]
+                for stage in self._stages
+            ]
+        }
+
+    def pre_input(self, input_):
+        return self._stages[0].pre_input(input_)
+
+    def pre_output(self, input_):
+        return self._stages[-1].pre_output(input_)
+
+
+def fuse_stages(stages: list) -> list:
+    """Group the consecutive stages that can run as a single stage.
+
+    A stage joins the previous one only if it does not change the input
+    batches (pre_input) and the previous one does not need its whole
+    output (pre_output). Barrier stages always run alone.
+
+    Args:
+        stages (list(Stage)): the pipeline stages
+
+    Returns:
+        list(Stage): the stages to run, with FusedStage for the groups
+    """
+    result = []
+    group = []
+
+    def close_group():
+        if len(group) > 1:
+            result.append(FusedStage(group[:]))
         else:
-            return tmp
+            result.extend(group)
+        group.clear()
+
+    for stage in stages:
+        if stage.barrier or type(stage).pre_input is not Stage.pre_input:
+            close_group()
+        group.append(stage)
+        if stage.barrier or type(stage).pre_output is not Stage.pre_output:
+            close_group()
+    close_group()
+
+    return result
@@ -0,0 +1,469 @@
+import json
+import os
+import time
+import unittest
+from functools import partial
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Lock
+from unittest import mock
+
+from ..api import DataFile
+from .cache import StageCache, callable_fingerprint
+from .checkpoint import RunManifest
+from .generator import Pipeline
+from .resource import Resource
+from .stage import FusedStage, Stage, fuse_stages, run_transforms
+from .window import IncrementalWindow
+
+
+class SlowStage(Stage):
+
+    """The later batches finish first."""
+
+    @staticmethod
+    def transform(records) -> list:
+        time.sleep(0.02 * (10 - records[0]['num']))
+        return [
+            {'num': record['num'], 'square': record['num'] ** 2}
+            for record in records
+        ]
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([SlowStage.transform], records, shard)
+
+
+class SquareStage(Stage):
+
+    @staticmethod
+    def transform(records) -> list:
+        return [
+            {'num': record['num'], 'square': record['num'] ** 2}
+            for record in records
+        ]
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([SquareStage.transform], records, shard)
+
+
+class SumStage(Stage):
+
+    @staticmethod
+    def transform(records) -> list:
+        return [
+            dict(record, sum=record['num'] + record['square'])
+            for record in records
+        ]
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([SumStage.transform], records, shard)
+
+
+class SortedStage(SumStage):
+
+    """Needs the whole output to sort it."""
+
+    def pre_output(self, output):
+        return sorted(output, key=lambda elm: -elm['num'])
+
+
+class EmptyStage(Stage):
+
+    """Filters out every record."""
+
+    @staticmethod
+    def transform(records) -> list:
+        return []
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([EmptyStage.transform], records, shard)
+
+
+class BarrierStage(SumStage):
+
+    barrier = True
+
+
+class ShuffleStage(SquareStage):
+
+    """The batches finish in another order with many workers."""
+
+    @staticmethod
+    def transform(records) -> list:
+        time.sleep(0.01 * (-records[0]['num'] % 5))
+        return SquareStage.transform(records)
+
+    @staticmethod
+    def process(records, shard: str = None):
+        return run_transforms([ShuffleStage.transform], records, shard)
+
+
+def crash_on(marker: str, num: int, records) -> list:
+    if os.path.isfile(marker) and any(record['num'] == num for record in records):
+        raise Exception("Crash on record {}".format(num))
+    return SumStage.transform(records)
+
+
+class CrashStage(Stage):
+
+    """Crashes on a record while the marker file exists."""
+
+    def __init__(self, name: str, marker: str, num: int, **kwargs):
+        super(CrashStage, self).__init__(name, **kwargs)
+        self.process = partial(run_transforms, [partial(crash_on, marker, num)])
+
+
+class Threshold(object):
+
+    """A value with the default repr, that contains its address."""
+
+    def __init__(self, value: int):
+        self.value = value
+
+
+MIN_NUM = 1
+
+
+def above_min_num(record) -> bool:
+    return record['num'] > MIN_NUM
+
+
+class NumbersResource(Resource):
+
+    def __init__(self, num_records: int, batch_size: int):
+        super(NumbersResource, self).__init__()
+        self.__num_records = num_records
+        self.__batch_size = batch_size
+
+    def get(self):
+        nums = list(range(self.__num_records))
+        return [
+            [{'num': num} for num in nums[start:start + self.__batch_size]]
+            for start in range(0, self.__num_records, self.__batch_size)
+        ]
+
+
+class TestStages(unittest.TestCase):
+
+    def test_stage_task(self):
+        batches = [[{'num': num}] for num in range(10)]
+        result = [{'num': num, 'square': num ** 2} for num in range(10)]
+
+        stage = SlowStage("slow", ordered=True, in_flight=4)
+        self.assertEqual(list(DataFile(stage.task(batches, num_process=4))), result)
+
+        stage = SlowStage("slow", in_flight=4)
+        self.assertEqual(
+            sorted(DataFile(stage.task(batches, num_process=4)), key=lambda elm: elm['num']),
+            result
+        )
+
+    def test_fuse_stages(self):
+        from .stage import CMSFeaturedStage, CMSRawStage, CMSRecordTest0Stage
+
+        stages = fuse_stages(
+            [CMSRawStage(), CMSFeaturedStage(), CMSRecordTest0Stage()])
+        self.assertEqual(len(stages), 2)
+        self.assertIsInstance(stages[0], FusedStage)
+        self.assertEqual(stages[0].name, "CMS-raw+CMS-Featured")
+        self.assertIsInstance(stages[1], CMSRecordTest0Stage)
+
+        # A stage that needs its whole output closes the group
+        stages = fuse_stages([
+            SquareStage("square"), SortedStage("sorted"), SumStage("sum")])
+        self.assertEqual(
+            [stage.name for stage in stages], ["square+sorted", "sum"])
+
+        # A barrier stage always runs alone
+        stages = fuse_stages([
+            SquareStage("square"), BarrierStage("barrier"), SumStage("sum")])
+        self.assertEqual(
+            [stage.name for stage in stages], ["square", "barrier", "sum"])
+
+    def test_fused_run(self):
+        results = []
+        for fuse in [False, True]:
+            pipeline = Pipeline(
+                stages=[SquareStage("square"), SumStage("sum")],
+                source=NumbersResource(50, 7),
+                batch_size=7
+            )
+            results.append(sorted(
+                pipeline.run(fuse=fuse).result, key=lambda elm: elm['num']))
+        self.assertEqual(list(pipeline.stats['time']['stages']), ["square+sum"])
+        self.assertEqual(len(results[0]), 50)
+        self.assertEqual(results[0][3], {'num': 3, 'square': 9, 'sum': 12})
+        self.assertEqual(results[0], results[1])
+
+    def test_empty_output(self):
+        for output_format in ['json', 'avro']:
+            pipeline = Pipeline(
+                stages=[EmptyStage("empty", output_format=output_format),
+                        SquareStage("square", output_format=output_format)],
+                source=NumbersResource(20, 7),
+                batch_size=7
+            )
+            self.assertEqual(list(pipeline.run().result), [])
+
+    def test_callable_fingerprint(self):
+        def greater(value, threshold):
+            return value > threshold
+
+        def make_predicate(threshold):
+            return lambda value: value > threshold
+
+        self.assertIsNone(callable_fingerprint(None))
+        self.assertNotEqual(
+            callable_fingerprint(lambda value: value > 1),
+            callable_fingerprint(lambda value: value > 2)
+        )
+        self.assertNotEqual(
+            callable_fingerprint(make_predicate(1)),
+            callable_fingerprint(make_predicate(2))
+        )
+        self.assertEqual(
+            callable_fingerprint(make_predicate(1)),
+            callable_fingerprint(make_predicate(1))
+        )
+        self.assertNotEqual(
+            callable_fingerprint(partial(greater, threshold=1)),
+            callable_fingerprint(partial(greater, threshold=2))
+        )
+
+        # Objects with the default repr are described by their state
+        def make_object_predicate(threshold):
+            return lambda value: value > threshold.value
+
+        self.assertIn(" at 0x", repr(Threshold(1)))
+        self.assertEqual(
+            callable_fingerprint(make_object_predicate(Threshold(1))),
+            callable_fingerprint(make_object_predicate(Threshold(1)))
+        )
+        self.assertNotEqual(
+            callable_fingerprint(make_object_predicate(Threshold(1))),
+            callable_fingerprint(make_object_predicate(Threshold(2)))
+        )
+        self.assertEqual(
+            callable_fingerprint(partial(greater, threshold=Threshold(1))),
+            callable_fingerprint(partial(greater, threshold=Threshold(1)))
+        )
+
+        # The module globals used by the function are part of it
+        global MIN_NUM
+        fingerprint = callable_fingerprint(above_min_num)
+        MIN_NUM = 2
+        try:
+            self.assertNotEqual(callable_fingerprint(above_min_num), fingerprint)
+        finally:
+            MIN_NUM = 1
+        self.assertEqual(callable_fingerprint(above_min_num), fingerprint)
+
+        # A value that cannot be described disables the cache
+        lock = Lock()
+        self.assertIsNone(callable_fingerprint(lambda value: lock))
+
+    def test_stage_cache(self):
+        cache_dir = mkdtemp()
+        try:
+            cache = StageCache(cache_dir, max_size=2 ** 30)
+            key = cache.key("input", SquareStage("square"), 7)
+            self.assertEqual(key, cache.key("input", SquareStage("square"), 7))
+            self.assertNotEqual(key, cache.key("input", SquareStage("square"), 8))
+            self.assertNotEqual(key, cache.key("input", SumStage("square"), 7))
+            self.assertNotEqual(key, cache.key("input", SquareStage("sum"), 7))
+            self.assertNotEqual(key, cache.key("other", SquareStage("square"), 7))
+
+            self.assertIsNone(cache.get(key))
+            records = [{'num': num} for num in range(100)]
+            self.assertEqual(list(cache.put(key, records)), records)
+            self.assertIn(key, cache)
+            self.assertEqual(list(cache.get(key)), records)
+
+            # Keep only the two most recently used entries
+            keys = [key, cache.key("input", SumStage("sum"), 7),
+                    cache.key("input", SortedStage("sorted"), 7)]
+            cache.put(keys[1], records)
+            entry_size = cache.size() // 2
+            cache = StageCache(cache_dir, max_size=2 * entry_size)
+            # The oldest entry is used again
+            for mtime, cur_key in enumerate(keys[:2]):
+                os.utime(os.path.join(
+                    cache_dir, "{}.json.gz".format(cur_key)), (mtime, mtime))
+            cache.get(keys[0])
+            cache.put(keys[2], records)
+            self.assertNotIn(keys[1], cache)
+            self.assertIn(keys[0], cache)
+            self.assertIn(keys[2], cache)
+            self.assertEqual(cache.size(), 2 * entry_size)
+        finally:
+            rmtree(cache_dir)
+
+    def test_incremental_window(self):
+        from ..datafile.avro import AvroDataFileWriter
+
+        def raw_record(process, wrap_cpu, type_="analysis"):
+            return {
+                'FileName': "/store/mc/Campaign/{}/AODSIM/file.root".format(process),
+                'TaskMonitorId': "task", 'WrapCPU': wrap_cpu,
+                'StartedRunningTimeStamp': 0, 'Type': type_
+            }
+
+        days = {
+            # Only the first day reads process-A, it leaves the window
+            1: [raw_record("process-A", 8.0), raw_record("process-B", 1.0)],
+            2: [raw_record("process-B", 2.0), raw_record("process-C", 4.0)],
+            3: [raw_record("process-B", 4.0), raw_record("process-C", 1.0),
+                raw_record("process-D", 16.0, "production")],
+            4: [raw_record("process-D", 2.0)]
+        }
+        base_dir = mkdtemp()
+        try:
+            for day, records in days.items():
+                day_dir = os.path.join(
+                    base_dir, "data", "year=2020", "month=1", "day={}".format(day))
+                os.makedirs(day_dir)
+                with AvroDataFileWriter(os.path.join(day_dir, "part-00000.avro"), data=records):
+                    pass
+
+            def get_window():
+                return IncrementalWindow(
+                    2,
+                    resource={'local': {'folder': os.path.join(base_dir, "data")}},
+                    partials_dir=os.path.join(base_dir, "partials")
+                )
+
+            def sort_records(records):
+                return sorted(records, key=lambda elm: elm['id'])
+
+            window = get_window().move_to("2020 1 1")
+            self.assertEqual(len(window), 3)
+            window.slide(1)
+            self.assertEqual(window.days, [(2020, 1, 2), (2020, 1, 3)])
+            records = sort_records(window.records)
+            self.assertEqual(len(records), 2)
+            self.assertEqual(
+                sorted(record['tot_requests'] for record in records), [2, 2])
+            self.assertEqual(
+                records, sort_records(get_window().move_to("2020 1 2").records))
+
+            window.slide(1)
+            self.assertEqual(
+                sort_records(window.records),
+                sort_records(get_window().move_to("2020 1 3").records)
+            )
+
+            # A missing day is an error, not a smaller window
+            with self.assertRaises(FileNotFoundError):
+                window.slide(1)
+        finally:
+            rmtree(base_dir)
+
+    def test_pipeline_resume(self):
+        run_dir = mkdtemp()
+        marker = os.path.join(run_dir, "crash")
+        result = [
+            {'num': num, 'square': num ** 2, 'sum': num + num ** 2}
+            for num in range(100)
+        ]
+
+        def get_pipeline(batch_size=7):
+            return Pipeline(
+                stages=[ShuffleStage("square", in_flight=4),
+                        CrashStage("sum", marker, 60, in_flight=4)],
+                source=NumbersResource(100, 7),
+                batch_size=batch_size,
+                checkpoint_dir=os.path.join(run_dir, "run")
+            )
+
+        try:
+            open(marker, 'w').close()
+            with self.assertRaises(Exception):
+                get_pipeline().run()
+            with self.assertRaises(Exception):
+                get_pipeline(batch_size=5).run(resume=True)
+            os.remove(marker)
+            pipeline = get_pipeline().run(resume=True)
+            self.assertEqual(
+                sorted(pipeline.result, key=lambda elm: elm['num']), result)
+
+            # A new run removes only the files of the previous one
+            open(os.path.join(run_dir, "run", "notes.txt"), 'w').close()
+            pipeline = get_pipeline().run()
+            self.assertEqual(
+                sorted(pipeline.result, key=lambda elm: elm['num']), result)
+            self.assertTrue(os.path.isfile(
+                os.path.join(run_dir, "run", "notes.txt")))
+            with self.assertRaises(Exception):
+                RunManifest(run_dir)
+        finally:
+            rmtree(run_dir)
+
+    def test_dataset_v0_metadata(self):
+        from ..datafeatures.extractor import CMSSimpleRecord
+        from ..datafile.json import JSONDataFileReader
+        from .generator import CMSDatasetV0
+        from .reader import CMSDatasetV0Reader
+        from .utils import SupportTable, metadata_path
+
+        def get_record(idx):
+            record = CMSSimpleRecord([('process', "process-{}".format(idx % 3))])
+            record.add_task("task-{}".format(idx))
+            record.add_wrap_cpu(1.0)
+            return record
+
+        support_tables = SupportTable()
+        for idx in range(3):
+            support_tables.insert('features', 'process', "process-{}".format(idx))
+        support_tables.gen_indexes()
+        records = {idx: get_record(idx) for idx in range(4)}
+        raw_data = [get_record(idx) for idx in range(10)]
+        raw_info = {'len_raw_window': 6, 'len_raw_next_window': 4}
+
+        base_dir = mkdtemp()
+        filename = os.path.join(base_dir, "dataset.json.gz")
+        try:
+            # The extraction is replaced by a small dataset
+            with mock.patch.object(CMSDatasetV0, '_extract', return_value=(
+                    records, support_tables, raw_data, raw_info)):
+                CMSDatasetV0().save(
+                    "2020 1 1", 1, outfile_name=filename, checkpoint_step=3)
+            self.assertTrue(os.path.isfile(metadata_path(filename)))
+            with open(metadata_path(filename)) as meta_file:
+                metadata = json.load(meta_file)
+            self.assertEqual(
+                sorted(int(index) for index in metadata['checkpoints']), [4, 7, 10, 13])
+
+            with mock.patch.object(
+                    JSONDataFileReader, 'add_checkpoint', autospec=True,
+                    side_effect=JSONDataFileReader.add_checkpoint) as add_checkpoint:
+                data = CMSDatasetV0Reader(filename)
+            checkpoints = set(
+                tuple(call[0][1:]) for call in add_checkpoint.call_args_list)
+            for index, pos in metadata['checkpoints'].items():
+                self.assertIn((int(index), pos), checkpoints)
+            self.assertEqual(len(data), 4)
+            raw_window = list(data.get_raw_window())
+            self.assertEqual(len(raw_window), 6)
+            self.assertEqual(raw_window[1]['features'], {'process': "process-1"})
+            next_window = list(data.get_raw_next_window())
+            self.assertEqual(
+                [record['features'] for record in next_window],
+                [{'process': "process-{}".format(idx % 3)} for idx in range(6, 10)]
+            )
+
+            # Without the sidecar the metadata is the last record
+            os.remove(metadata_path(filename))
+            data = CMSDatasetV0Reader(filename)
+            self.assertEqual(data.meta.checkpoints, metadata['checkpoints'])
+            self.assertEqual(data.meta.len_raw_window, 6)
+            self.assertEqual(len(list(data.get_raw_next_window())), 4)
+        finally:
+            rmtree(base_dir)
+
+
+if __name__ == '__main__':
+    unittest.main()
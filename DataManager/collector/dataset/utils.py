@@ -135,6 +135,18 @@ def gen_window_dates(year: int, month: int, day: int, window_size: int, step: in
         start_date += window_step
 
 
+def metadata_path(filename: str) -> str:
+    """Get the sidecar metadata filename of a dataset file.
+
+    Args:
+        filename (str): the dataset file name
+
+    Returns:
+        str: the metadata file name
+    """
+    return "{}.meta.json".format(filename)
+
+
 def flush_queue(queue):
     """Get all data from the queue.
 
@@ -152,6 +164,27 @@ def flush_queue(queue):
     return data
 
 
+def write_shard(shard: str, records) -> tuple:
+    """Write serialized records to a shard file.
+
+    Notes: this is just a multiprocessing support function, the workers
+    return the small manifest instead of the records.
+
+    Args:
+        shard (str): the shard file name
+        records (list(str)): the JSON strings to write
+
+    Returns:
+        tuple: (str, int, int) the shard file name, the number of records
+               and the number of bytes written
+    """
+    data = "".join(
+        "{}\n".format(record) for record in records).encode("utf-8")
+    with open(shard, 'wb') as shard_file:
+        shard_file.write(data)
+    return shard, len(records), len(data)
+
+
 class SupportTable(object):
 
     """Class to manage support tables for feature conversions."""
@@ -0,0 +1,228 @@
+from hashlib import sha256
+from os import makedirs, path, replace
+
+from tqdm import tqdm
+
+from ..api import DataFile
+from ..datafeatures.extractor import (CMS_RAW_FIELDS, CMSRecordTest0,
+                                      is_analysis_record)
+from ..datafile.bgzf import BLOCK_SIZE
+from ..datafile.json import JSONDataFileWriter
+from .resource import CMSResourceManager
+from .stage import CMSFeaturedStage, CMSRawStage, classify_records
+from .utils import gen_window_dates
+
+__all__ = ['IncrementalWindow']
+
+
+class IncrementalWindow(object):
+
+    """Sliding window of CMSRecordTest0 aggregates.
+
+    The aggregates of each day are computed once and stored as partials
+    keyed by record_id. Moving the window adds the partials of the new
+    days and subtracts the ones of the days that dropped out, so only
+    the new days are processed.
+    """
+
+    def __init__(
+        self,
+        window_size: int,
+        resource: dict = {},
+        partials_dir: str = path.join("cache", "partials"),
+        fields: list = CMS_RAW_FIELDS,
+        predicate=is_analysis_record,
+        batch_size: int = 42000,
+        spark_conf: dict = {}
+    ):
+        """Prepare an empty window.
+
+        Args:
+            window_size (int): the number of days of the window
+            resource (dict): where to find the data (see CMSResourceManager)
+            partials_dir (str): the folder of the daily partials
+            fields (list(str)): decode only these fields of the records
+            predicate (callable): select the records to read
+            batch_size (int): number of records processed together
+            spark_conf (dict): the Spark configuration of the source
+
+        Returns:
+            IncrementalWindow: the instance of this object
+        """
+        self._window_size = window_size
+        self._resource = resource
+        self._partials_dir = partials_dir
+        self._fields = fields
+        self._predicate = predicate
+        self._batch_size = batch_size
+        self._spark_conf = spark_conf
+        # The partial file of each day in the window
+        self._days = {}
+        self._aggregates = {}
+        makedirs(partials_dir, exist_ok=True)
+
+    @property
+    def days(self) -> list:
+        return sorted(self._days)
+
+    def __len__(self):
+        return len(self._aggregates)
+
+    def __source(self, year: int, month: int, day: int) -> 'CMSResourceManager':
+        return CMSResourceManager(
+            "{} {} {}".format(year, month, day), 1,
+            spark_conf=self._spark_conf,
+            resource=self._resource,
+            fields=self._fields,
+            predicate=self._predicate
+        )
+
+    def __partial_path(self, year: int, month: int, day: int) -> tuple:
+        """Get the file of a daily partial.
+
+        The name contains the fingerprint of the day source, a partial
+        is computed again when the files of the day change.
+
+        Returns:
+            tuple: (str, bool) the file name and if it can be reused,
+                   that is if the source has a fingerprint
+        """
+        fingerprint = self.__source(year, month, day).fingerprint()
+        if fingerprint is None:
+            return path.join(
+                self._partials_dir,
+                "day_y{}-m{}-d{}_nocache.json.gz".format(year, month, day)
+            ), False
+        fingerprint = sha256(fingerprint.encode("utf-8")).hexdigest()
+        return path.join(
+            self._partials_dir,
+            "day_y{}-m{}-d{}_{}.json.gz".format(
+                year, month, day, fingerprint[:16])
+        ), True
+
+    def __gen_batches(self, data):
+        batch = []
+        for record in data:
+            batch.append(record)
+            if len(batch) == self._batch_size:
+                yield batch
+                batch = []
+        else:
+            if len(batch) != 0:
+                yield batch
+
+    def __compute(self, year: int, month: int, day: int) -> dict:
+        """Aggregate the records of a day.
+
+        Returns:
+            dict: the CMSRecordTest0 aggregates by record_id
+        """
+        aggregates = {}
+        for collector in self.__source(year, month, day).get():
+            for batch in self.__gen_batches(collector):
+                records = CMSFeaturedStage.transform(
+                    CMSRawStage.transform(batch))
+                for record in records:
+                    new_record = CMSRecordTest0(record)
+                    if new_record.record_id not in aggregates:
+                        aggregates[new_record.record_id] = new_record
+                    else:
+                        aggregates[new_record.record_id] += new_record
+        return aggregates
+
+    def partial_file(self, year: int, month: int, day: int) -> str:
+        """Get the file of the aggregates of a day, computing them only once.
+
+        When the predicate cannot be fingerprinted (see
+        callable_fingerprint) the day is computed at every call.
+
+        Args:
+            year (int): year of the day
+            month (int): month of the day
+            day (int): the day
+
+        Returns:
+            str: the partial file name (CMSRecordTest0 dicts)
+        """
+        filename, reuse = self.__partial_path(year, month, day)
+        if not reuse or not path.isfile(filename):
+            print("[IncrementalWindow][Compute day {}-{:02d}-{:02d}]".format(
+                year, month, day))
+            aggregates = self.__compute(year, month, day)
+            tmp_filename = path.join(
+                self._partials_dir, "tmp_{}".format(path.basename(filename)))
+            with JSONDataFileWriter(tmp_filename, block_size=BLOCK_SIZE) as out_file:
+                out_file.extend(
+                    record.to_dict() for record in aggregates.values())
+            # Sidecars first, the partial exists only when it is complete
+            for sidecar in [".blocks", ".count"]:
+                if path.isfile(tmp_filename + sidecar):
+                    replace(tmp_filename + sidecar, filename + sidecar)
+            replace(tmp_filename, filename)
+        return filename
+
+    def __add_day(self, date: tuple):
+        filename = self.partial_file(*date)
+        for record in DataFile(filename):
+            cur_record = CMSRecordTest0().load(record)
+            if cur_record.record_id not in self._aggregates:
+                self._aggregates[cur_record.record_id] = cur_record
+            else:
+                self._aggregates[cur_record.record_id] += cur_record
+        self._days[date] = filename
+
+    def __remove_day(self, date: tuple):
+        # The same partial that was added, even if the day changed since
+        for record in DataFile(self._days.pop(date)):
+            cur_record = CMSRecordTest0().load(record)
+            window_record = self._aggregates.get(cur_record.record_id)
+            if window_record is None:
+                continue
+            window_record -= cur_record
+            if window_record.tot_requests <= 0:
+                del self._aggregates[cur_record.record_id]
+
+    def move_to(self, start_date: str) -> 'IncrementalWindow':
+        """Move the window to a new first day.
+
+        Args:
+            start_date (str): the first day, in the format "YYYY MM DD"
+
+        Returns:
+            IncrementalWindow: this object
+        """
+        year, month, day = [int(elm) for elm in start_date.split()]
+        new_days = list(gen_window_dates(year, month, day, self._window_size))
+        for cur_day in tqdm(
+                [elm for elm in self._days if elm not in new_days],
+                desc="[Remove days]"):
+            self.__remove_day(cur_day)
+        for cur_day in tqdm(
+                [elm for elm in new_days if elm not in self._days],
+                desc="[Add days]"):
+            self.__add_day(cur_day)
+        return self
+
+    def slide(self, days: int = 1) -> 'IncrementalWindow':
+        """Move the window forward.
+
+        Args:
+            days (int): the number of days to move
+
+        Returns:
+            IncrementalWindow: this object
+        """
+        assert self._days, "Move the window to a start date first..."
+        year, month, day = list(
+            gen_window_dates(*self.days[0], days + 1))[-1]
+        return self.move_to("{} {} {}".format(year, month, day))
+
+    @property
+    def records(self) -> list:
+        """The window aggregates with their class, as CMSRecordTest0Stage."""
+        if not self._aggregates:
+            return []
+        return classify_records(
+            CMSRecordTest0().load(record.to_dict())
+            for record in self._aggregates.values()
+        )
@@ -130,7 +130,7 @@ class LRUCache(SimpleCache):
 
 class Evaluator(object):
 
-    def __init__(self, dataset, model, cache_type: str='simple', ai_cache_type: str='simple', cache_settings: dict={}):
+    def __init__(self, dataset, model, cache_type: str='simple', ai_cache_type: str='simple', cache_settings: dict={}, prefetch: int=0):
         self._dataset = dataset
         self._model = model
         self.__cache_type = cache_type.lower()
@@ -141,6 +141,8 @@ class Evaluator(object):
             'fifo': FIFOCache
         }
         self.__cache_settings = cache_settings
+        # Chunks of raw records decoded ahead of the simulation
+        self.__prefetch = prefetch
 
     def _compare(
         self, initial_values: dict={}, next_window: bool=False
@@ -161,9 +163,9 @@ class Evaluator(object):
 
         generator = None
         if not next_window:
-            generator = self._dataset.get_raw_window()
+            generator = self._dataset.get_raw_window(prefetch=self.__prefetch)
         else:
-            generator = self._dataset.get_raw_next_window()
+            generator = self._dataset.get_raw_next_window(prefetch=self.__prefetch)
 
         for idx, obj in tqdm(enumerate(generator), desc="Simulation"):
             FileName = obj['data']['FileName']
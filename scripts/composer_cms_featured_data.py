@@ -3,6 +3,9 @@ from os import chdir
 
 sys.path.append("..")
 
+from DataManager.collector.datafeatures.extractor import (CMS_RAW_FIELDS,
+                                                          is_analysis_record)
+from DataManager.collector.dataset.cache import StageCache
 from DataManager.collector.dataset.generator import Pipeline
 from DataManager.collector.dataset.resource import CMSResourceManager
 from DataManager.collector.dataset.stage import CMSRawStage, CMSFeaturedStage
@@ -14,7 +17,9 @@ if __name__ == "__main__":
 
     cms_resource_manager = CMSResourceManager(
         sys.argv[1], int(sys.argv[2]),
-        resource=eval(sys.argv[3])
+        resource=eval(sys.argv[3]),
+        fields=CMS_RAW_FIELDS,
+        predicate=is_analysis_record
     )
 
     raw_stage = CMSRawStage(
@@ -30,6 +35,7 @@ if __name__ == "__main__":
             featured_Stage
         ],
         source=cms_resource_manager,
+        cache=StageCache(),
         spark_conf={
             'master': "local[8]",
             'config': {